@@ -9,15 +9,40 @@ import json
 import time
 import sys
 import logging
+import re
 import fnmatch
-import hashlib
+import mmap
+import errno
+import faulthandler
+import signal
+import threading
+from contextlib import closing
 from pathlib import Path
 from datetime import datetime
-from typing import Set, Dict, List, Tuple, Any, Optional
+from typing import Set, Dict, List, Tuple, Any, Optional, Iterator, Pattern, NamedTuple, TYPE_CHECKING
 from dataclasses import dataclass, field
 from functools import lru_cache
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+if TYPE_CHECKING:
+    import sqlite3  # только для аннотаций; импортируется при mirror_db
+
+# orjson - необязательная зависимость для быстрой сериализации метаданных
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import xxhash  # быстрый некриптографический хэш для verify_content
+except ImportError:
+    xxhash = None
 
 # --- Настройка логирования ---
 logging.basicConfig(
@@ -30,6 +55,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Конфигурация по умолчанию (запуск без аргументов)
+DEFAULT_CONFIG_FILE = "backup_config.json"
+
+# Версия формата mirror.json: 2 - mtime хранится целым числом наносекунд (mtime_ns)
+MIRROR_STATE_VERSION = 2
+NS_PER_SECOND = 1_000_000_000
+
+# Индекс состояния mirror в SQLite (включается опцией mirror_db)
+MIRROR_DB_NAME = "mirror.db"
+MIRROR_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    rel_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    tracked INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_tracked ON files (tracked);
+"""
+
+# Размер пачки файлов, передаваемой одной задаче пула копирования
+COPY_BATCH_SIZE = 32
+# Имя временного файла атомарной замены в mirror (см. temp_copy_path)
+TEMP_COPY_NAME_RE = re.compile(r'\..+\.\d+\.tmp\Z', re.S)
+# Потоков копирования на HDD: больше - лишние перемещения головок
+HDD_COPY_WORKERS = 4
+
+# Размер блока чтения при вычислении хэша содержимого (verify_content)
+HASH_CHUNK_SIZE = 1024 * 1024
+# Размер начального и конечного фрагментов для быстрой сверки с копией в mirror
+SAMPLE_SIZE = 64 * 1024
+
+# Копирование данных файла системным вызовом sendfile (без буферов в user space)
+USE_SENDFILE = sys.platform.startswith('linux') and hasattr(os, 'sendfile')
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024
+# copy_file_range копирует внутри ядра, а на одной ФС (btrfs, XFS, NFSv4.2)
+# может вообще не переносить данные (reflink / копирование на сервере)
+USE_COPY_FILE_RANGE = USE_SENDFILE and hasattr(os, 'copy_file_range')
+# os.scandir по дескриптору директории (POSIX): stat записей через fstatat
+SCANDIR_DIR_FD = os.scandir in os.supports_fd and hasattr(os, 'O_DIRECTORY')
+# Ошибки, означающие, что способ копирования не поддерживается для этой пары файлов
+COPY_UNSUPPORTED_ERRNOS = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EXDEV)
+# ioctl FICLONE (linux/fs.h): клон файла с общими экстентами (btrfs, XFS), данные не копируются
+FICLONE = 0x40049409
+USE_REFLINK = sys.platform.startswith('linux') and fcntl is not None
+
+class MirrorEntry(NamedTuple):
+    """Состояние файла в mirror.
+    
+    Кортеж вместо словаря на каждый файл: в памяти в несколько раз меньше,
+    а в mirror.json по-прежнему пишется объект с теми же ключами.
+    """
+    size: int
+    mtime_ns: int
+    tracked: bool
+    hash: Optional[str] = None  # хэш содержимого, если он вычислялся (verify_content)
+
+class BackupStats(NamedTuple):
+    """Итоги запуска бэкапа (результат execute_backup)"""
+    total_files: int
+    tracked_files: int
+    new_files: int
+    changed_files: int
+    deleted_files: int
+    backup_time: float
+
 # --- Кэшированные вспомогательные функции ---
 
 @lru_cache(maxsize=10000)
@@ -40,6 +131,34 @@ def get_relative_path_cached(path: Path, base: Path) -> Path:
     except ValueError:
         return Path(path.name) if path.parent == base else path
 
+def relative_path_strings(paths: Set[Path], base: Path) -> Dict[Path, str]:
+    """Относительные пути строками (ключи mirror_state) для множества файлов.
+    
+    Для путей внутри base - срез строки без relative_to и создания Path.
+    """
+    prefix = os.path.join(str(base), '')
+    cut = len(prefix)
+    result = {}
+    for path in paths:
+        path_str = str(path)
+        if path_str.startswith(prefix):
+            result[path] = path_str[cut:]
+        else:
+            result[path] = str(get_relative_path_cached(path, base))
+    return result
+
+def find_files_outside(paths: Set[Path], base: Path) -> Set[Path]:
+    """Файлы, чей путь (после разрешения символических ссылок) не лежит внутри base"""
+    prefix = os.path.join(str(base), '')
+    return {path for path in paths if not str(path).startswith(prefix)}
+
+def is_path_within_root(rel_path: str) -> bool:
+    """Остается ли os.path.join(root, rel_path) внутри root: путь не абсолютный
+    и не содержит '..' (ключи mirror_state могли сохранить старые версии)"""
+    if os.path.isabs(rel_path):
+        return False
+    return os.pardir not in rel_path or os.pardir not in rel_path.split(os.sep)
+
 @lru_cache(maxsize=1000)
 def parse_pattern_cached(pattern: str) -> Tuple[str, bool]:
     """Кэшированная версия parse_pattern"""
@@ -48,151 +167,748 @@ def parse_pattern_cached(pattern: str) -> Tuple[str, bool]:
         return pattern[:-4], True
     return pattern, False
 
+def normalize_file_patterns(patterns: Set[str]) -> Set[str]:
+    """Шаблоны файлов без завершающего перевода строки; пустые шаблоны и шаблоны
+    из одних пробелов отбрасываются. Остальные пробелы сохраняются: они могут
+    быть частью имени файла"""
+    return {pattern.rstrip('\r\n') for pattern in patterns if pattern and not pattern.isspace()}
+
+@lru_cache(maxsize=1000)
+def translate_pattern_cached(pattern: str) -> str:
+    """Кэшированный fnmatch.translate (шаблон без суффикса :rec)"""
+    return fnmatch.translate(pattern)
+
 @lru_cache(maxsize=10000)
-def get_file_metadata_cached(file_path: Path) -> Tuple[int, float]:
-    """Кэшированная версия get_file_metadata (только размер и время модификации)"""
+def get_file_metadata_cached(file_path: Path) -> Tuple[int, int]:
+    """Кэшированная версия get_file_metadata (размер и mtime в наносекундах)"""
     try:
         stat = file_path.stat()
-        return (stat.st_size, stat.st_mtime)
+        return (stat.st_size, stat.st_mtime_ns)
     except Exception as e:
         logger.warning(f"Error getting metadata for {file_path}: {e}")
         return (0, 0)
 
-@lru_cache(maxsize=10000)
-def is_dir_excluded_cached(dir_path: Path, exclude_dirs: Tuple[Path]) -> bool:
-    """Кэшированная проверка исключения директории"""
-    return any(exclude_dir in dir_path.parents or exclude_dir == dir_path for exclude_dir in exclude_dirs)
+def dump_json_bytes(data: Any, indent: bool = True) -> bytes:
+    """Сериализация в JSON (через orjson, если он установлен).
+    
+    indent=False дает компактный JSON для файлов, которые читает только программа.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2) if indent else orjson.dumps(data)
+    if indent:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def load_json_bytes(data: bytes) -> Any:
+    """Разбор JSON из байтов (через orjson, если он установлен)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def load_json_file(path: Path) -> Any:
+    """Чтение JSON-файла.
+    
+    С orjson файл разбирается прямо из отображения в память (mmap), без
+    промежуточной копии содержимого в bytes; без него - через load_json_bytes.
+    """
+    with open(path, 'rb') as f:
+        if orjson is not None and os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+        return load_json_bytes(f.read())
+
+def parse_mirror_json(data: Dict) -> Dict[str, MirrorEntry]:
+    """Состояние mirror из содержимого mirror.json любой версии.
+    
+    В версии 1 (словарь файлов без обертки) mtime хранился в секундах
+    с плавающей точкой; он переводится в целые наносекунды.
+    """
+    # Ключи интернируются: те же относительные пути строит сканирование
+    # источника и mirror, и в памяти остается одна копия каждой строки
+    intern = sys.intern
+    if isinstance(data.get("version"), int) and isinstance(data.get("files"), dict):
+        return {
+            intern(rel_path): MirrorEntry(info.get('size', 0), info.get('mtime_ns', 0), info.get('tracked', False),
+                                  info.get('hash'))
+            for rel_path, info in data["files"].items()
+        }
+    
+    return {
+        intern(rel_path): MirrorEntry(info.get('size', 0), int(round(info.get('mtime', 0) * NS_PER_SECOND)),
+                              info.get('tracked', False))
+        for rel_path, info in data.items()
+    }
+
+def mirror_json_files(state: Dict[str, MirrorEntry]) -> Dict[str, Dict]:
+    """Содержимое раздела "files" в mirror.json (hash пишется, только если известен)"""
+    files = {}
+    for rel_path, entry in state.items():
+        info = {'size': entry.size, 'mtime_ns': entry.mtime_ns, 'tracked': entry.tracked}
+        if entry.hash is not None:
+            info['hash'] = entry.hash
+        files[rel_path] = info
+    return files
+
+def file_content_hash(file_path: Path) -> Optional[str]:
+    """Хэш содержимого файла: XXH3-128, если установлен xxhash, иначе BLAKE2b;
+    None, если файл не читается.
+    
+    Хэш XXH3 хранится с префиксом алгоритма: с хэшем другого алгоритма он
+    не совпадет, и файл один раз будет считаться измененным.
+    """
+    if xxhash is not None:
+        digest, prefix = xxhash.xxh3_128(), "xxh3:"
+    else:
+        import hashlib  # нужен только без xxhash и только при verify_content
+        digest, prefix = hashlib.blake2b(), ""
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError as e:
+        logger.warning(f"Can't hash {file_path}: {e}")
+        return None
+    return prefix + digest.hexdigest()
+
+def read_file_samples(file_path: str, size: int) -> Optional[Tuple[bytes, bytes]]:
+    """Начальный и конечный фрагменты файла размера size; None, если файл не читается"""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(SAMPLE_SIZE)
+            if size <= SAMPLE_SIZE:
+                return head, b''
+            f.seek(max(size - SAMPLE_SIZE, SAMPLE_SIZE))
+            return head, f.read(SAMPLE_SIZE)
+    except OSError:
+        return None
+
+def samples_differ(src_path: str, mirror_path: str, size: int) -> bool:
+    """Быстрая проверка различия содержимого файлов одного размера.
+    
+    Сравниваются только начало и конец файлов: различие в них доказывает
+    изменение без чтения файла целиком, а совпадение ничего не доказывает.
+    """
+    src_samples = read_file_samples(src_path, size)
+    return src_samples is None or src_samples != read_file_samples(mirror_path, size)
+
+def ensure_mirror_db_schema(conn: "sqlite3.Connection"):
+    """Создание таблицы mirror.db; в индекс старой версии добавляется колонка hash"""
+    conn.executescript(MIRROR_DB_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+    if 'hash' not in columns:
+        conn.execute("ALTER TABLE files ADD COLUMN hash TEXT")
+
+# --- Префиксное дерево исключенных директорий ---
+
+# Маркер конца пути исключенной директории в узле trie
+TRIE_END = None
+
+def build_exclude_trie(exclude_dirs: Set[Path]) -> Dict:
+    """Построение trie исключенных директорий по компонентам пути.
+    
+    Пути добавляются от коротких к длинным, и директории внутри уже
+    исключенных в trie не попадают: обход до них все равно не дойдет.
+    """
+    trie = {}
+    for exclude_dir in sorted(exclude_dirs, key=lambda p: len(p.parts)):
+        node = trie
+        for part in exclude_dir.parts:
+            if TRIE_END in node:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[TRIE_END] = True
+    return trie
+
+def find_exclude_node(dir_path: Path, exclude_trie: Dict) -> Optional[Dict]:
+    """Спуск по trie вдоль dir_path за O(глубины).
+    
+    Возвращает None, если под dir_path исключений нет, либо узел trie
+    (с маркером TRIE_END, если dir_path сама лежит в исключенной директории).
+    """
+    node = exclude_trie
+    for part in dir_path.parts:
+        node = node.get(part)
+        if node is None or TRIE_END in node:
+            return node
+    return node
 
 # --- Функции для работы с шаблонами ---
 
-def expand_directory_patterns(base_path: Path, patterns: List[str]) -> Set[Path]:
-    """Развертывание шаблонов директорий в абсолютные пути"""
-    expanded = set()
-    base_path = base_path.resolve()
+def is_glob_fallback_pattern(pattern: str) -> bool:
+    """Шаблоны, которые обрабатываются через pathlib.glob ('**' и абсолютные пути)"""
+    return '**' in pattern or pattern.startswith('/')
+
+@dataclass
+class CompiledPatterns:
+    """Glob-шаблоны, скомпилированные для сопоставления за один обход дерева.
     
-    for pattern in patterns:
-        try:
-            if not pattern or pattern.strip() == "":
+    Однокомпонентные шаблоны (самый частый случай) объединяются в одно
+    регулярное выражение по имени; многокомпонентные сверяются покомпонентно,
+    как в pathlib.glob ('*' не пересекает '/').
+    """
+    top_names: Optional[Pattern] = None  # имя на первом уровне base_path
+    rec_names: Optional[Pattern] = None  # имя на любой глубине (:rec)
+    # Многокомпонентные шаблоны: без :rec - по числу компонентов (сверяются только
+    # с путями той же глубины), с :rec - по концу пути любой большей глубины
+    exact_multi: Dict[int, List[Tuple[Pattern, ...]]] = field(default_factory=dict)
+    rec_multi: List[Tuple[Pattern, ...]] = field(default_factory=list)
+    max_depth: Optional[int] = 0  # None - глубина обхода не ограничена
+    
+    @classmethod
+    def compile(cls, parsed: List[Tuple[str, bool]]) -> 'CompiledPatterns':
+        """Компиляция списка пар (шаблон, рекурсивный)"""
+        top, rec = [], []
+        exact_multi, rec_multi = {}, []
+        max_depth = 0
+        for pat, is_rec in parsed:
+            parts = [p for p in pat.split('/') if p and p != '.']
+            if not parts:
                 continue
-                
-            # Для шаблонов с wildcards используем glob
-            if '*' in pattern or '?' in pattern or '[' in pattern:
-                matches = list(base_path.glob(pattern))
-                for match in matches:
-                    if match.exists() and match.is_dir():
-                        expanded.add(match.resolve())
+            if len(parts) == 1:
+                (rec if is_rec else top).append(translate_pattern_cached(parts[0]))
             else:
-                # Для простых путей проверяем существование
-                dir_path = base_path / pattern
-                if dir_path.exists() and dir_path.is_dir():
-                    expanded.add(dir_path.resolve())
-        except Exception as e:
-            logger.warning(f"Error expanding directory pattern '{pattern}': {e}")
-    return expanded
+                components = tuple(re.compile(translate_pattern_cached(p)) for p in parts)
+                if is_rec:
+                    rec_multi.append(components)
+                else:
+                    exact_multi.setdefault(len(components), []).append(components)
+            if is_rec:
+                max_depth = None
+            elif max_depth is not None:
+                max_depth = max(max_depth, len(parts))
+        return cls(
+            top_names=re.compile('|'.join(top)) if top else None,
+            rec_names=re.compile('|'.join(rec)) if rec else None,
+            exact_multi=exact_multi,
+            rec_multi=rec_multi,
+            max_depth=max_depth
+        )
+    
+    def matches(self, parts: Tuple[str, ...]) -> bool:
+        """Проверка относительного пути, заданного кортежем компонентов"""
+        name = parts[-1]
+        if self.rec_names is not None and self.rec_names.match(name):
+            return True
+        if self.top_names is not None and len(parts) == 1 and self.top_names.match(name):
+            return True
+        for components in self.exact_multi.get(len(parts), ()):
+            if all(c.match(p) for c, p in zip(components, parts)):
+                return True
+        for components in self.rec_multi:
+            k = len(components)
+            if len(parts) >= k and all(c.match(p) for c, p in zip(components, parts[-k:])):
+                return True
+        return False
 
-def expand_file_patterns(base_path: Path, patterns: List[str]) -> Set[Path]:
-    """Развертывание шаблонов файлов в абсолютные пути"""
-    expanded = set()
-    base_path = base_path.resolve()
+def iter_tree_entries(base: str, max_depth: Optional[int] = None) -> Iterator[Tuple[Tuple[str, ...], os.DirEntry]]:
+    """Обход дерева через os.scandir: (компоненты относительного пути, DirEntry)"""
+    stack = [(base, ())]
+    while stack:
+        current, parts = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    entry_parts = parts + (entry.name,)
+                    yield entry_parts, entry
+                    if ((max_depth is None or len(entry_parts) < max_depth) and
+                            entry.is_dir(follow_symlinks=False)):
+                        stack.append((entry.path, entry_parts))
+        except (PermissionError, OSError) as e:
+            logger.warning(f"Can't scan directory {current}: {e}")
 
-    for pattern in patterns:
-        pat, is_rec = parse_pattern_cached(pattern)
+def entry_path(entry: os.DirEntry) -> Path:
+    """Абсолютный путь записи; символические ссылки разрешаются, как делал resolve()"""
+    if entry.is_symlink():
+        return Path(entry.path).resolve()
+    return Path(entry.path)
 
-        try:
-            if is_rec:
-                matches = base_path.rglob(pat)
-            else:
-                matches = base_path.glob(pat)
+def expand_directory_pattern_groups(base_path: Path, pattern_groups: List[List[str]]) -> List[Set[Path]]:
+    """Развертывание нескольких групп шаблонов директорий в абсолютные пути.
+    
+    Wildcard-шаблоны всех групп сопоставляются за один общий обход дерева.
+    base_path - абсолютный путь без символических ссылок (как BackupConfig.src).
+    """
+    results = []
+    compiled_groups = []
+    
+    for patterns in pattern_groups:
+        expanded = set()
+        wildcard_patterns = []
+        for pattern in patterns:
+            try:
+                if not pattern or pattern.strip() == "":
+                    continue
+                    
+                # Шаблоны с wildcards сопоставляются за один общий обход дерева
+                if '*' in pattern or '?' in pattern or '[' in pattern:
+                    if is_glob_fallback_pattern(pattern):
+                        for match in base_path.glob(pattern):
+                            if match.is_dir():
+                                expanded.add(match.resolve())
+                    else:
+                        wildcard_patterns.append((pattern, False))
+                else:
+                    # Для простых путей проверяем существование
+                    dir_path = base_path / pattern
+                    if dir_path.is_dir():
+                        expanded.add(dir_path.resolve())
+            except Exception as e:
+                logger.warning(f"Error expanding directory pattern '{pattern}': {e}")
+        
+        results.append(expanded)
+        if wildcard_patterns:
+            compiled_groups.append((CompiledPatterns.compile(wildcard_patterns), expanded))
+    
+    if compiled_groups:
+        depths = [compiled.max_depth for compiled, _ in compiled_groups]
+        max_depth = None if None in depths else max(depths)
+        for parts, entry in iter_tree_entries(str(base_path), max_depth):
+            matched = [expanded for compiled, expanded in compiled_groups if compiled.matches(parts)]
+            if matched and entry.is_dir():
+                path = entry_path(entry)
+                for expanded in matched:
+                    expanded.add(path)
+    return results
 
-            for match in matches:
-                if match.is_file() and match.exists():
-                    expanded.add(match.resolve())
-        except Exception as e:
-            logger.error(f"Error expanding pattern '{pattern}': {e}")
+def expand_file_pattern_groups(base_path: Path, pattern_groups: List[List[str]]) -> List[Set[Path]]:
+    """Развертывание нескольких групп шаблонов файлов в абсолютные пути.
+    
+    Шаблоны всех групп сопоставляются за один общий обход дерева.
+    base_path - абсолютный путь без символических ссылок (как BackupConfig.src).
+    """
+    results = []
+    compiled_groups = []
 
-    return expanded
+    for patterns in pattern_groups:
+        expanded = set()
+        parsed = []
+        for pattern in patterns:
+            pat, is_rec = parse_pattern_cached(pattern)
+            if not is_glob_fallback_pattern(pat):
+                parsed.append((pat, is_rec))
+                continue
+
+            try:
+                if is_rec:
+                    matches = base_path.rglob(pat)
+                else:
+                    matches = base_path.glob(pat)
 
-def is_file_excluded(file_path: Path, exclude_patterns: List[str], src_path: Path) -> bool:
-    """Проверка исключения файла по шаблонам"""
-    rel_path = get_relative_path_cached(file_path, src_path)
+                for match in matches:
+                    if match.is_file():
+                        expanded.add(match.resolve())
+            except Exception as e:
+                logger.error(f"Error expanding pattern '{pattern}': {e}")
+
+        results.append(expanded)
+        if parsed:
+            compiled_groups.append((CompiledPatterns.compile(parsed), expanded))
+
+    if compiled_groups:
+        depths = [compiled.max_depth for compiled, _ in compiled_groups]
+        max_depth = None if None in depths else max(depths)
+        for parts, entry in iter_tree_entries(str(base_path), max_depth):
+            matched = [expanded for compiled, expanded in compiled_groups if compiled.matches(parts)]
+            if matched and entry.is_file():
+                path = entry_path(entry)
+                for expanded in matched:
+                    expanded.add(path)
+    return results
+
+def compile_file_patterns(patterns: List[str]) -> Optional[Pattern]:
+    """Компиляция шаблонов файлов в одно регулярное выражение.
     
-    for pattern in exclude_patterns:
+    Суффикс :rec разбирается один раз: рекурсивные шаблоны сверяются
+    с относительным путем целиком, остальные - с его последним компонентом
+    (просмотр вперед не дает шаблону имени захватить разделитель).
+    """
+    rec, names = [], []
+    for pattern in patterns:
         pat, is_rec = parse_pattern_cached(pattern)
-        if is_rec:
-            if fnmatch.fnmatch(str(rel_path), pat):
-                return True
-        else:
-            if fnmatch.fnmatch(rel_path.name, pat):
-                return True
-    return False
+        (rec if is_rec else names).append(translate_pattern_cached(pat))
+    if names:
+        seps = re.escape(os.sep) + (re.escape(os.altsep) if os.altsep else '')
+        rec.append(f"(?s:.*[{seps}])?(?=[^{seps}]*\\Z)(?:{'|'.join(names)})")
+    return re.compile('|'.join(rec)) if rec else None
+
+def find_excluded_files(rel_paths: Dict[Path, str], exclude_patterns: Optional[Pattern]) -> Set[Path]:
+    """Файлы (ключи rel_paths), относительные пути которых попадают под exclude-шаблоны"""
+    if exclude_patterns is None:
+        return set()
+    # Связанный метод выражения: без вызова функции-обертки на каждый файл
+    match = exclude_patterns.match
+    return {f for f, rel_path in rel_paths.items() if match(rel_path) is not None}
 
 # --- Сканирование файловой системы ---
 
-def scan_directory_recursive(dir_path: Path, exclude_dirs: Set[Path]) -> Set[Path]:
-    """Рекурсивное сканирование директории с исключениями"""
-    files = set()
+def scan_dir_entries(current: str, node: Optional[Dict], prune_subdirs: bool = False,
+                     string_keys: bool = False, rel_prefix: Optional[str] = None, key_cut: int = 0,
+                     with_metadata: bool = True
+                     ) -> Tuple[Dict[Any, Tuple[int, int]], List[Tuple[str, Optional[Dict]]], Dict[Any, str]]:
+    """Чтение одной директории: файлы с метаданными, поддиректории для обхода
+    и относительные пути файлов.
     
+    node - узел trie исключений для current; для поддиректорий возвращается
+    их собственный узел, чтобы не искать его повторно от корня.
+    string_keys=True - пути файлов возвращаются строками, без создания Path;
+    при key_cut > 0 от них отрезается префикс корня обхода (ключ - относительный
+    путь, символические ссылки не разрешаются).
+    rel_prefix - путь базовой директории с завершающим разделителем: для файлов
+    под ней относительный путь берется срезом строки DirEntry.path.
+    with_metadata=False - stat файлов не выполняется, вместо метаданных None.
+    """
+    files = {}
+    subdirs = []
+    rels = {}
+    trie_end = TRIE_END
+    # Относительные пути - будущие ключи mirror_state: интернируются, чтобы
+    # скан источника, скан mirror и загруженное состояние делили одни строки
+    intern = sys.intern
+    cut = len(rel_prefix) if rel_prefix is not None else 0
+    # Директория читается через дескриптор: stat записей идет через fstatat
+    # относительно него, и ядро не разбирает каждый раз весь путь от корня.
+    # Пути записей тогда собираются из current
+    dir_prefix = os.path.join(current, '')
+    dir_fd = None
     try:
-        for root, dirs, filenames in os.walk(dir_path):
-            current_dir = Path(root)
-            
-            # Исключаем директории из exclude_dirs
-            dirs[:] = [d for d in dirs if not is_dir_excluded_cached(current_dir / d, tuple(exclude_dirs))]
-            
-            # Добавляем файлы
-            for filename in filenames:
-                file_path = current_dir / filename
-                if file_path.is_file():
-                    files.add(file_path.resolve())
+        if SCANDIR_DIR_FD:
+            dir_fd = os.open(current, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+        with os.scandir(current if dir_fd is None else dir_fd) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if prune_subdirs:
+                        continue
+                    child = node.get(entry.name) if node is not None else None
+                    if child is None or trie_end not in child:
+                        subdirs.append((dir_prefix + entry.name, child))
+                elif entry.is_file():
+                    entry_path = dir_prefix + entry.name
+                    metadata = None
+                    if with_metadata:
+                        try:
+                            st = entry.stat()
+                        except OSError as e:
+                            logger.warning(f"Error getting metadata for {entry_path}: {e}")
+                            continue
+                        metadata = (st.st_size, st.st_mtime_ns)
+                    if key_cut:
+                        files[intern(entry_path[key_cut:])] = metadata
+                        continue
+                    file_path = os.path.realpath(entry_path) if entry.is_symlink() else entry_path
+                    key = file_path if string_keys else Path(file_path)
+                    files[key] = metadata
+                    if cut and file_path.startswith(rel_prefix):
+                        rels[key] = intern(file_path[cut:])
     except (PermissionError, OSError) as e:
-        logger.warning(f"Can't scan directory {dir_path}: {e}")
+        logger.warning(f"Can't scan directory {current}: {e}")
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return files, subdirs, rels
+
+def walk_tree(root: Path, exclude_trie: Optional[Dict] = None, max_workers: int = 1,
+              string_keys: bool = False, rel_paths: Optional[Dict[Any, str]] = None,
+              rel_base: Optional[Path] = None, executor: Optional[ThreadPoolExecutor] = None,
+              relative_keys: bool = False,
+              cancel: Optional[threading.Event] = None) -> Dict[Any, Tuple[int, int]]:
+    """Единый обход дерева через os.scandir: путь файла -> (размер, mtime_ns).
     
-    return files
+    Используется и для источника, и для mirror. При max_workers > 1 каждая
+    директория читается отдельной задачей пула, а найденные поддиректории
+    сразу ставятся в очередь: на сетевых ФС и SSD это скрывает задержки
+    отдельных readdir/stat. string_keys - см. scan_dir_entries.
+    Если передан rel_paths, в него добавляются пути файлов относительно
+    rel_base (для файлов, лежащих под rel_base). executor - общий пул потоков
+    вызывающего кода; без него пул на max_workers создается на время обхода.
+    relative_keys=True - ключи результата - строки путей относительно root.
+    cancel - событие, после установки которого обход прекращается (результат
+    при этом неполный).
+    """
+    return walk_trees([root], exclude_trie, max_workers, string_keys, rel_paths, rel_base,
+                      executor, relative_keys, cancel)[0]
 
-def scan_all_directories(directories: Set[Path], exclude_dirs: Set[Path]) -> Set[Path]:
-    """Сканирование всех директорий с исключениями"""
-    all_files = set()
+def walk_trees(roots: List[Path], exclude_trie: Optional[Dict] = None, max_workers: int = 1,
+               string_keys: bool = False, rel_paths: Optional[Dict[Any, str]] = None,
+               rel_base: Optional[Path] = None, executor: Optional[ThreadPoolExecutor] = None,
+               relative_keys: bool = False, cancel: Optional[threading.Event] = None,
+               with_metadata: bool = True) -> List[Dict[Any, Tuple[int, int]]]:
+    """Обход нескольких деревьев одной очередью задач (параметры - см. walk_tree;
+    with_metadata - см. scan_dir_entries).
+    
+    Корни ставятся в очередь пула сразу все, поэтому хвост обхода одного
+    дерева не простаивает в ожидании следующего. Возвращается список
+    результатов в порядке roots.
+    """
+    results = [{} for _ in roots]
+    tasks = []  # (индекс результата, директория, узел trie, prune_subdirs, параметры)
+    for index, root in enumerate(roots):
+        root_node = find_exclude_node(root, exclude_trie) if exclude_trie else None
+        options = {'string_keys': string_keys or relative_keys}
+        if not with_metadata:
+            options['with_metadata'] = False
+        if relative_keys:
+            options['key_cut'] = len(os.path.join(str(root), ''))
+        if rel_paths is not None:
+            options['rel_prefix'] = os.path.join(str(rel_base), '')
+        # Корень внутри исключенной директории: берем только его собственные файлы
+        prune_subdirs = root_node is not None and TRIE_END in root_node
+        tasks.append((index, str(root), root_node, prune_subdirs, options))
     
-    for dir_path in directories:
-        if not is_dir_excluded_cached(dir_path, tuple(exclude_dirs)):
-            all_files.update(scan_directory_recursive(dir_path, exclude_dirs))
+    if executor is None and max_workers <= 1:
+        while tasks and not (cancel is not None and cancel.is_set()):
+            index, current, node, prune_subdirs, options = tasks.pop()
+            dir_files, subdirs, rels = scan_dir_entries(current, node, prune_subdirs, **options)
+            results[index].update(dir_files)
+            if rel_paths is not None:
+                rel_paths.update(rels)
+            tasks.extend((index, path, child, False, options) for path, child in subdirs)
+        return results
     
-    return all_files
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as own_executor:
+            return walk_trees(roots, exclude_trie, max_workers, string_keys, rel_paths, rel_base,
+                              own_executor, relative_keys, cancel, with_metadata)
+    
+    pending = {}  # future -> (индекс результата, параметры)
+    for index, current, node, prune_subdirs, options in tasks:
+        future = executor.submit(scan_dir_entries, current, node, prune_subdirs, **options)
+        pending[future] = (index, options)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        if cancel is not None and cancel.is_set():
+            # Еще не начатые задачи снимаются; выполняющиеся завершатся сами
+            for future in pending:
+                future.cancel()
+            break
+        for future in done:
+            index, options = pending.pop(future)
+            dir_files, subdirs, rels = future.result()
+            results[index].update(dir_files)
+            if rel_paths is not None:
+                rel_paths.update(rels)
+            for current, node in subdirs:
+                pending[executor.submit(scan_dir_entries, current, node, **options)] = (index, options)
+    
+    return results
 
-def remove_empty_dirs(path: Path, preserve_dirs: Set[str] = None):
-    """Рекурсивно удаляет пустые директории, исключая preserve_dirs"""
+def remove_empty_dirs(path: Path, preserve_dirs: Set[str] = None) -> bool:
+    """Рекурсивно удаляет пустые директории, исключая preserve_dirs.
+    
+    Каждая директория читается один раз: после обработки поддиректорий
+    ее пустота определяется по счетчику оставшихся записей, без повторного
+    os.scandir. Возвращает True, если сама path удалена.
+    """
     if preserve_dirs is None:
         preserve_dirs = set()
         
     try:
-        # Сначала обрабатываем поддиректории
-        for child in path.iterdir():
-            if child.is_dir():
-                remove_empty_dirs(child, preserve_dirs)
+        # Сначала обрабатываем поддиректории (тип берется из DirEntry без stat;
+        # по символическим ссылкам на директории не переходим)
+        remaining = 0
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    remaining += 1
+        for child in subdirs:
+            if not remove_empty_dirs(Path(child), preserve_dirs):
+                remaining += 1
         
         # Проверяем, пуста ли текущая директория и не должна ли быть сохранена
-        if path.is_dir() and not any(path.iterdir()):
+        if not remaining:
             dir_name = path.name
             if not any(p in dir_name for p in preserve_dirs):
                 try:
                     path.rmdir()
-                    logger.debug(f"Removed empty directory: {path}")
+                    logger.debug("Removed empty directory: %s", path)
+                    return True
                 except (OSError, PermissionError) as e:
                     logger.warning(f"Can't remove directory {path}: {e}")
     except (PermissionError, OSError) as e:
         logger.warning(f"Can't access directory {path}: {e}")
+    return False
+
+def remove_empty_parents(removed_files: Set[Path], root: Path, preserve_dirs: Set[str] = None) -> int:
+    """Удаляет опустевшие родительские директории удаленных файлов (снизу вверх, до root)"""
+    if preserve_dirs is None:
+        preserve_dirs = set()
+    
+    # Группируем кандидатов по глубине, чтобы родитель проверялся после всех потомков;
+    # директории вне root не трогаются, даже если в removed_files попал чужой путь
+    root_parts = root.parts
+    root_depth = len(root_parts)
+    by_depth: Dict[int, Set[Path]] = {}
+    for file_path in removed_files:
+        parent = file_path.parent
+        if parent.parts[:root_depth] == root_parts:
+            by_depth.setdefault(len(parent.parts), set()).add(parent)
+    
+    depth = max(by_depth, default=root_depth)
+    removed = 0
+    while depth > root_depth:
+        for dir_path in by_depth.pop(depth, ()):
+            if any(p in dir_path.name for p in preserve_dirs):
+                continue
+            try:
+                # rmdir сам отказывает для непустой директории - отдельная проверка не нужна
+                dir_path.rmdir()
+            except OSError:
+                continue
+            removed += 1
+            logger.debug("Removed empty directory: %s", dir_path)
+            by_depth.setdefault(depth - 1, set()).add(dir_path.parent)
+        depth -= 1
+    return removed
+
+def copy_file_range_all(src_fd: int, dst_fd: int) -> bool:
+    """Копирование через os.copy_file_range; False, если он не поддерживается
+    для этих файлов (тогда ничего не скопировано)"""
+    copied = 0
+    while True:
+        try:
+            count = os.copy_file_range(src_fd, dst_fd, SENDFILE_CHUNK_SIZE)
+        except OSError as e:
+            if copied == 0 and e.errno in COPY_UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        if count == 0:
+            # 0 на первом вызове - пустой файл или ФС, которая не умеет
+            # copy_file_range: это проверит sendfile
+            return copied > 0
+        copied += count
+
+def temp_copy_path(path: str) -> str:
+    """Временный файл рядом с path для атомарной замены через os.replace"""
+    dir_name, name = os.path.split(path)
+    return os.path.join(dir_name, f".{name}.{os.getpid()}.tmp")
+
+def copy_file_contents(src: Any, dst: str):
+    """Копирование содержимого файла src в dst (dst создается или перезаписывается).
+    
+    В отличие от shutil.copyfile не делает отдельных stat() для проверок
+    samefile и специальных файлов: dst здесь - всегда новый временный файл.
+    На Linux данные передаются через os.copy_file_range или os.sendfile,
+    иначе - через shutil.copyfile.
+    """
+    if not USE_SENDFILE:
+        shutil.copyfile(src, dst)
+        return
+    
+    src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o666)
+        try:
+            if USE_COPY_FILE_RANGE and copy_file_range_all(src_fd, dst_fd):
+                return
+            offset = 0
+            while True:
+                try:
+                    sent = os.sendfile(dst_fd, src_fd, offset, SENDFILE_CHUNK_SIZE)
+                except OSError as e:
+                    # ФС не поддерживает sendfile - копируем обычным чтением/записью
+                    if offset == 0 and e.errno in COPY_UNSUPPORTED_ERRNOS:
+                        with open(src_fd, 'rb', closefd=False) as fsrc, open(dst_fd, 'wb', closefd=False) as fdst:
+                            shutil.copyfileobj(fsrc, fdst)
+                        return
+                    raise
+                if sent == 0:
+                    return
+                offset += sent
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+def reflink_file(src: str, dst: str) -> bool:
+    """Создание dst клоном src (ioctl FICLONE). False, если ФС или пара файлов
+    клонирование не поддерживают - dst тогда не создается"""
+    if not USE_REFLINK:
+        return False
+    try:
+        src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return False
+    try:
+        try:
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o666)
+        except OSError:
+            return False
+        cloned = True
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        except OSError:
+            cloned = False
+        finally:
+            os.close(dst_fd)
+        if not cloned:
+            os.unlink(dst)
+        return cloned
+    finally:
+        os.close(src_fd)
+
+def is_rotational_device(path: Path) -> Optional[bool]:
+    """Лежит ли path на вращающемся диске (по /sys/dev/block/.../queue/rotational).
+    
+    None, если это не удалось определить (не Linux, сетевая ФС, tmpfs).
+    """
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return None
+    block_dir = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    # У раздела нет своего queue - он есть у родительского диска
+    for queue_dir in (os.path.join(block_dir, "queue"), os.path.join(block_dir, "..", "queue")):
+        try:
+            with open(os.path.join(queue_dir, "rotational")) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+def make_parent_dirs(paths: List[str]):
+    """Создание родительских директорий путей, по одному разу на директорию.
+    
+    Обычно директория уже есть: один mkdir дешевле, чем makedirs (stat
+    родителя + mkdir); makedirs нужен только при отсутствии родителя.
+    """
+    for parent in sorted({os.path.dirname(path) for path in paths}, key=lambda p: p.count(os.sep)):
+        try:
+            os.mkdir(parent)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            try:
+                os.makedirs(parent, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Can't create directory {parent}: {e}")
+        except OSError as e:
+            logger.error(f"Can't create directory {parent}: {e}")
 
-def create_hardlink_or_copy(src: Path, dst: Path) -> bool:
-    """Создает hardlink если возможно, иначе копирует файл"""
+def create_hardlink_or_copy(src: str, dst: str, make_dirs: bool = True) -> bool:
+    """Создает hardlink если возможно, иначе reflink или копию файла.
+    
+    Hardlink не удается, например, при превышении числа ссылок на файл mirror
+    (EMLINK) или на ФС без hardlink-ов; на CoW ФС клон тогда все равно не
+    копирует данные. make_dirs=False - родительская директория уже создана.
+    """
     try:
-        dst.parent.mkdir(parents=True, exist_ok=True)
+        if make_dirs:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
         os.link(src, dst)
-        logger.debug(f"Created hardlink: {src} -> {dst}")
+        logger.debug("Created hardlink: %s -> %s", src, dst)
         return True
     except (OSError, AttributeError):
         try:
-            shutil.copy2(src, dst)
-            logger.debug(f"Copied file (hardlink failed): {src} -> {dst}")
+            if reflink_file(src, dst):
+                logger.debug("Created reflink (hardlink failed): %s -> %s", src, dst)
+            else:
+                copy_file_contents(src, dst)
+                logger.debug("Copied file (hardlink failed): %s -> %s", src, dst)
+            shutil.copystat(src, dst)
             return True
         except Exception as e:
             logger.error(f"Copy failed {src} -> {dst}: {e}")
@@ -214,20 +930,29 @@ class BackupConfig:
     track_files: Set[str] = field(default_factory=set)
     preserved_dirs: Set[str] = field(default_factory=set)
     max_workers: int = 8
+    size_only: bool = False  # сравнивать файлы только по размеру (без mtime)
+    mirror_db: bool = False  # хранить состояние mirror в SQLite (mirror.db) вместо mirror.json
+    verify_content: bool = False  # сверять хэш содержимого track файлов с измененными метаданными
     
     def __post_init__(self):
         """Валидация конфигурации"""
         self.src = self.src.resolve()
         self.dst = self.dst.resolve()
         
-        if not self.src.exists():
-            raise ValueError(f"Source path does not exist: {self.src}")
-            
         if not self.src.is_dir():
+            if not self.src.exists():
+                raise ValueError(f"Source path does not exist: {self.src}")
             raise ValueError(f"Source path is not a directory: {self.src}")
             
         if self.directory_priority not in ["include", "track"]:
             raise ValueError("directory_priority must be 'include' or 'track'")
+        
+        # Шаблоны файлов нормализуются один раз при загрузке: пустые строки
+        # отбрасываются, а перевод строки в конце не дает шаблону разойтись
+        # с таким же в проверке конфликтов и в кэше разбора
+        self.include_files = normalize_file_patterns(self.include_files)
+        self.exclude_files = normalize_file_patterns(self.exclude_files)
+        self.track_files = normalize_file_patterns(self.track_files)
             
         self.dst.mkdir(parents=True, exist_ok=True)
         
@@ -251,114 +976,245 @@ class AxiomaticBackupSystem:
         self.cfg = cfg
         self.all_files: Set[Path] = set()
         self.tracked_files: Set[Path] = set()
-        self.mirror_state: Dict[str, Dict] = {}
+        self.file_metadata: Dict[Path, Tuple[int, int]] = {}
+        self.rel_paths: Dict[Path, str] = {}  # файл -> относительный путь (ключ mirror_state)
+        self.source_rel_paths: Set[str] = set()  # относительные пути всех файлов all_files
+        self.content_hashes: Dict[str, str] = {}  # хэши, вычисленные в этом запуске (verify_content)
+        self.content_unchanged_files: Set[Path] = set()  # изменились только метаданные
+        self.mirror_state: Dict[str, MirrorEntry] = {}
+        self.stored_mirror_state: Dict[str, MirrorEntry] = {}  # содержимое mirror.db на момент загрузки/сохранения
         self.tracked_new_files: Set[Path] = set()
         self.tracked_changed_files: Set[Path] = set()
         self.tracked_deleted_files: Set[Path] = set()
-        self.load_mirror_state()
+        # Пулы потоков создаются при первом использовании и живут до close().
+        # Состояние mirror загружается в execute_backup: конструктор не делает
+        # ввода-вывода, и dry run его не читает
+        self.scan_executor: Optional[ThreadPoolExecutor] = None
+        self.copy_executor: Optional[ThreadPoolExecutor] = None
+
+    def get_scan_executor(self) -> Optional[ThreadPoolExecutor]:
+        """Общий пул для обходов дерева и хэширования (None при max_workers <= 1)"""
+        if self.cfg.max_workers <= 1:
+            return None
+        if self.scan_executor is None:
+            self.scan_executor = ThreadPoolExecutor(max_workers=self.cfg.max_workers)
+        return self.scan_executor
+
+    def get_copy_executor(self) -> ThreadPoolExecutor:
+        """Общий пул копирования (число потоков - detect_copy_workers)"""
+        if self.copy_executor is None:
+            self.copy_executor = ThreadPoolExecutor(max_workers=self.detect_copy_workers())
+        return self.copy_executor
+
+    def close(self):
+        """Остановка пулов потоков"""
+        for executor in (self.scan_executor, self.copy_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.scan_executor = None
+        self.copy_executor = None
+
+    def detect_copy_workers(self) -> int:
+        """Число потоков копирования: max_workers из конфигурации; на HDD
+        параллельные потоки вызывают перемещения головок - их не больше
+        HDD_COPY_WORKERS."""
+        workers = self.cfg.max_workers
+        if workers > HDD_COPY_WORKERS and is_rotational_device(self.cfg.dst):
+            logger.info(f"Destination is on a rotational disk, using {HDD_COPY_WORKERS} copy threads")
+            return HDD_COPY_WORKERS
+        return workers
 
     def load_mirror_state(self):
-        """Загрузка состояния mirror"""
+        """Загрузка состояния mirror.
+        
+        Сохраняется только один из файлов mirror.json/mirror.db (второй
+        удаляется), поэтому после переключения mirror_db состояние читается
+        из файла прежнего формата.
+        """
+        db_exists = (self.cfg.dst / MIRROR_DB_NAME).exists()
+        if self.cfg.mirror_db and db_exists:
+            self.load_mirror_db()
+            return
+        
+        # Без mirror.db (в том числе при первом включении mirror_db) читаем mirror.json
         mirror_file = self.cfg.dst / "mirror.json"
-        if mirror_file.exists():
+        if not mirror_file.exists() and db_exists:
+            # mirror_db выключен, состояние сохранено при включенном
+            self.load_mirror_db()
+        elif mirror_file.exists():
             try:
-                with open(mirror_file, 'r', encoding='utf-8') as f:
-                    self.mirror_state = json.load(f)
+                self.mirror_state = parse_mirror_json(load_json_file(mirror_file))
                 logger.info(f"Loaded mirror state with {len(self.mirror_state)} files")
-            except Exception as e:
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                # Нечитаемый или поврежденный mirror.json (JSONDecodeError - подкласс ValueError)
                 logger.error(f"Error loading mirror state: {e}")
                 self.mirror_state = {}
         else:
             logger.info("No existing mirror state found")
 
+    def load_mirror_db(self):
+        """Загрузка состояния mirror из SQLite-индекса"""
+        import sqlite3  # нужен только при mirror_db
+        db_file = self.cfg.dst / MIRROR_DB_NAME
+        try:
+            with closing(sqlite3.connect(str(db_file))) as conn:
+                with conn:
+                    ensure_mirror_db_schema(conn)
+                rows = conn.execute("SELECT rel_path, size, mtime_ns, tracked, hash FROM files").fetchall()
+            intern = sys.intern  # см. parse_mirror_json
+            self.mirror_state = {
+                intern(rel_path): MirrorEntry(size, mtime_ns, bool(tracked), content_hash)
+                for rel_path, size, mtime_ns, tracked, content_hash in rows
+            }
+            self.stored_mirror_state = dict(self.mirror_state)
+            logger.info(f"Loaded mirror state with {len(self.mirror_state)} files from {MIRROR_DB_NAME}")
+        except sqlite3.Error as e:
+            logger.error(f"Error loading mirror state: {e}")
+            self.mirror_state = {}
+
+    def save_mirror_db(self):
+        """Сохранение состояния mirror в SQLite: пишутся только изменившиеся строки"""
+        import sqlite3  # нужен только при mirror_db
+        db_file = self.cfg.dst / MIRROR_DB_NAME
+        stored = self.stored_mirror_state
+        removed = [(rel_path,) for rel_path in stored.keys() - self.mirror_state.keys()]
+        changed = [
+            (rel_path, entry.size, entry.mtime_ns, int(entry.tracked), entry.hash)
+            for rel_path, entry in self.mirror_state.items()
+            if stored.get(rel_path) != entry
+        ]
+        
+        try:
+            with closing(sqlite3.connect(str(db_file))) as conn:
+                # Одна транзакция на все изменения
+                with conn:
+                    ensure_mirror_db_schema(conn)
+                    conn.executemany("DELETE FROM files WHERE rel_path = ?", removed)
+                    conn.executemany("INSERT OR REPLACE INTO files (rel_path, size, mtime_ns, tracked, hash) "
+                                     "VALUES (?, ?, ?, ?, ?)", changed)
+            self.stored_mirror_state = dict(self.mirror_state)
+            logger.info(f"Mirror state saved with {len(self.mirror_state)} files "
+                        f"({len(changed)} updated, {len(removed)} removed)")
+        except sqlite3.Error as e:
+            logger.error(f"Error saving mirror state: {e}")
+            return
+        self.remove_stale_mirror_state("mirror.json")
+
+    def remove_stale_mirror_state(self, name: str):
+        """Удаление файла состояния mirror в другом формате после сохранения текущего.
+        
+        Оставшись, он устарел бы и при обратном переключении mirror_db был бы
+        загружен вместо актуального состояния.
+        """
+        try:
+            (self.cfg.dst / name).unlink()
+            logger.info(f"Removed outdated mirror state {name}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Can't remove outdated mirror state {name}: {e}")
+
     def save_mirror_state(self):
         """Сохранение состояния mirror"""
+        if self.cfg.mirror_db:
+            self.save_mirror_db()
+            return
+        
         mirror_file = self.cfg.dst / "mirror.json"
         temp_file = self.cfg.dst / "mirror.json.tmp"
         
         try:
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.mirror_state, f, indent=2, ensure_ascii=False)
+            with open(temp_file, 'wb') as f:
+                # mirror.json читает только программа - пишем без отступов
+                f.write(dump_json_bytes(
+                    {"version": MIRROR_STATE_VERSION, "files": mirror_json_files(self.mirror_state)}, indent=False))
             temp_file.replace(mirror_file)
             logger.info(f"Mirror state saved with {len(self.mirror_state)} files")
         except Exception as e:
             logger.error(f"Error saving mirror state: {e}")
             if temp_file.exists():
                 temp_file.unlink()
+            return
+        self.remove_stale_mirror_state(MIRROR_DB_NAME)
 
-    def build_file_sets(self):
-        """Построение множеств файлов с учетом приоритета директорий"""
+    def build_file_sets(self, with_metadata: bool = True):
+        """Построение множеств файлов с учетом приоритета директорий.
+        
+        with_metadata=False - только множества all_files и tracked_files:
+        без stat файлов и без file_metadata/rel_paths (для подсчета в dry run).
+        """
         logger.info("Building file sets...")
         
+        # Шаблоны файлов не зависят от директорий: их обход (шаг 4) идет
+        # в общем пуле параллельно с шагами 1-3
+        file_pattern_groups = [list(self.cfg.include_files), list(self.cfg.track_files)]
+        executor = self.get_scan_executor()
+        file_patterns_future = None
+        if executor is not None and (self.cfg.include_files or self.cfg.track_files):
+            file_patterns_future = executor.submit(expand_file_pattern_groups, self.cfg.src,
+                                                   file_pattern_groups)
+        
         # 1. Формируем множества директорий
-        include_dirs = expand_directory_patterns(self.cfg.src, list(self.cfg.include_dirs))
-        track_dirs = expand_directory_patterns(self.cfg.src, list(self.cfg.track_dirs))
-        exclude_dirs = expand_directory_patterns(self.cfg.src, list(self.cfg.exclude_dirs))
+        # (один обход дерева на все три группы шаблонов)
+        include_dirs, track_dirs, exclude_dirs = expand_directory_pattern_groups(
+            self.cfg.src,
+            [list(self.cfg.include_dirs), list(self.cfg.track_dirs), list(self.cfg.exclude_dirs)]
+        )
         
         logger.info(f"Included directories: {len(include_dirs)}")
         logger.info(f"Tracked directories: {len(track_dirs)}")
         logger.info(f"Excluded directories: {len(exclude_dirs)}")
         
         # 2. Сканируем все директории
-        all_scanned_files = set()
-        file_to_dir_type = {}  # Для каждого файла сохраняем тип директории, в которой он находится
-        
-        # Сначала сканируем include_dirs
-        for dir_path in include_dirs:
-            files_in_dir = scan_directory_recursive(dir_path, exclude_dirs)
-            all_scanned_files.update(files_in_dir)
-            for file_path in files_in_dir:
-                file_to_dir_type[file_path] = 'include'
-        
-        # Затем сканируем track_dirs, но переопределяем тип для файлов, которые уже есть в include_dirs
-        for dir_path in track_dirs:
-            files_in_dir = scan_directory_recursive(dir_path, exclude_dirs)
-            for file_path in files_in_dir:
-                if file_path in file_to_dir_type:
-                    # Файл уже есть в include_dirs, проверяем приоритет
-                    if self.cfg.directory_priority == "include":
-                        # Приоритет include - оставляем как include
-                        pass
-                    else:
-                        # Приоритет track - меняем на track
-                        file_to_dir_type[file_path] = 'track'
-                else:
-                    # Файла нет в include_dirs, добавляем как track
-                    file_to_dir_type[file_path] = 'track'
-                    all_scanned_files.add(file_path)
+        exclude_trie = build_exclude_trie(exclude_dirs)
+        include_scanned = {}  # файл -> (размер, mtime_ns), полученные при сканировании
+        track_scanned = {}
+        scanned_rel_paths = {}  # файл -> относительный путь, вычисленный при сканировании
+        
+        # Все корни include и track обходятся одной очередью общего пула
+        include_roots = list(include_dirs)
+        results = walk_trees(include_roots + list(track_dirs), exclude_trie,
+                             rel_paths=scanned_rel_paths, rel_base=self.cfg.src,
+                             executor=executor, with_metadata=with_metadata)
+        for index, scanned in enumerate(results):
+            (include_scanned if index < len(include_roots) else track_scanned).update(scanned)
+        
+        scanned_metadata = {**include_scanned, **track_scanned}
+        # Символические ссылки разрешены сканированием - их пути считаем отдельно
+        scanned_rel_paths.update(relative_path_strings(scanned_metadata.keys() - scanned_rel_paths.keys(),
+                                                       self.cfg.src))
         
-        # 3. Разделяем файлы по типам
-        files_from_include_dirs = {f for f, t in file_to_dir_type.items() if t == 'include'}
-        files_from_track_dirs = {f for f, t in file_to_dir_type.items() if t == 'track'}
+        # 3. Разделяем файлы по типам: файл из обеих групп директорий
+        # относится к группе с приоритетом (разность множеств ключей считается в C)
+        if self.cfg.directory_priority == "include":
+            files_from_include_dirs = set(include_scanned)
+            files_from_track_dirs = track_scanned.keys() - include_scanned.keys()
+        else:
+            files_from_track_dirs = set(track_scanned)
+            files_from_include_dirs = include_scanned.keys() - track_scanned.keys()
         
         logger.info(f"Files from include directories: {len(files_from_include_dirs)}")
         logger.info(f"Files from track directories: {len(files_from_track_dirs)}")
         
         # 4. Получаем файлы из шаблонов
-        include_files = expand_file_patterns(self.cfg.src, list(self.cfg.include_files))
-        track_files = expand_file_patterns(self.cfg.src, list(self.cfg.track_files))
+        # (один обход дерева на обе группы шаблонов)
+        if file_patterns_future is not None:
+            include_files, track_files = file_patterns_future.result()
+        else:
+            include_files, track_files = expand_file_pattern_groups(self.cfg.src, file_pattern_groups)
         
         # 5. Применяем приоритет include над track для файлов
         track_files = track_files - include_files
         
         # 6. Применяем exclude_files только к файлам из директорий
+        # (один проход по всем просканированным файлам)
         if self.cfg.exclude_files:
-            excluded_count = 0
-            filtered_files_from_include_dirs = set()
-            for file_path in files_from_include_dirs:
-                if is_file_excluded(file_path, list(self.cfg.exclude_files), self.cfg.src):
-                    excluded_count += 1
-                else:
-                    filtered_files_from_include_dirs.add(file_path)
-            
-            filtered_files_from_track_dirs = set()
-            for file_path in files_from_track_dirs:
-                if is_file_excluded(file_path, list(self.cfg.exclude_files), self.cfg.src):
-                    excluded_count += 1
-                else:
-                    filtered_files_from_track_dirs.add(file_path)
+            exclude_patterns = compile_file_patterns(list(self.cfg.exclude_files))
+            excluded = find_excluded_files(scanned_rel_paths, exclude_patterns)
+            filtered_files_from_include_dirs = files_from_include_dirs - excluded
+            filtered_files_from_track_dirs = files_from_track_dirs - excluded
             
-            logger.info(f"Excluded {excluded_count} files from directories by exclude patterns")
+            logger.info(f"Excluded {len(excluded)} files from directories by exclude patterns")
         else:
             filtered_files_from_include_dirs = files_from_include_dirs
             filtered_files_from_track_dirs = files_from_track_dirs
@@ -371,294 +1227,496 @@ class AxiomaticBackupSystem:
             track_files
         )
         
+        # Символическая ссылка может вести за пределы src: у такого файла нет
+        # относительного пути, и путь в mirror совпал бы с самим файлом
+        outside = find_files_outside(self.all_files, self.cfg.src)
+        if outside:
+            for file_path in outside:
+                logger.warning(f"Skipping file outside source directory: {file_path}")
+            self.all_files -= outside
+        
         self.tracked_files = (
             filtered_files_from_track_dirs | 
             track_files
         ) & self.all_files
         
+        if not with_metadata:
+            logger.info(f"All files: {len(self.all_files)}")
+            logger.info(f"Tracked files: {len(self.tracked_files)}")
+            return
+        
+        # Метаданные берем из сканирования; stat нужен только файлам из шаблонов
+        self.file_metadata = {
+            f: scanned_metadata[f] if f in scanned_metadata else get_file_metadata_cached(f)
+            for f in self.all_files
+        }
+        # Относительные пути известны из сканирования; вычисляются только для
+        # файлов из шаблонов
+        rel_paths = {f: scanned_rel_paths[f] for f in self.all_files if f in scanned_rel_paths}
+        rel_paths.update(relative_path_strings(self.all_files - rel_paths.keys(), self.cfg.src))
+        self.rel_paths = rel_paths
+        self.source_rel_paths = set(rel_paths.values())
+        
         logger.info(f"All files: {len(self.all_files)}")
         logger.info(f"Tracked files: {len(self.tracked_files)}")
 
-    def get_changes(self) -> Tuple[Set[Path], Set[Path], Set[Path]]:
-        """Определение изменений для track файлов"""
-        current_tracked = self.tracked_files
+    def count_file_sets(self) -> Tuple[int, int]:
+        """Число файлов для бэкапа и track файлов без сбора их метаданных"""
+        self.build_file_sets(with_metadata=False)
+        return len(self.all_files), len(self.tracked_files)
+
+    def quick_check_key(self, size: int, mtime_ns: int) -> Tuple:
+        """Ключ быстрой проверки (quick check, как в rsync): размер и mtime в целых секундах"""
+        if self.cfg.size_only:
+            return (size,)
+        return (size, mtime_ns // NS_PER_SECOND)
+
+    def get_changes(self) -> Tuple[Set[Path], Set[Path], Set[str]]:
+        """Определение изменений для track файлов.
         
-        # Файлы, которые были track в mirror_state
-        previous_tracked = set()
-        for rel_path_str, info in self.mirror_state.items():
-            if info.get('tracked', False):
-                absolute_path = self.cfg.src / rel_path_str
-                previous_tracked.add(absolute_path)
+        Удаленные файлы возвращаются относительными путями (ключами mirror_state):
+        их нет в источнике, и все операции с ними идут по относительному пути.
+        """
+        rel_paths = self.rel_paths
         
-        # Удаленные track файлы: были track, но теперь отсутствуют в all_files
-        deleted_files = previous_tracked - self.all_files
+        # Файлы, которые были track в mirror_state (относительные пути строками)
+        previous_tracked = {
+            rel_path_str for rel_path_str, entry in self.mirror_state.items()
+            if entry.tracked
+        }
         
-        # Новые track файлы: сейчас track, но не были в предыдущем состоянии
-        new_files = current_tracked - previous_tracked
+        # Удаленные track файлы: были track, но теперь отсутствуют в all_files
+        deleted_files = previous_tracked - self.source_rel_paths
         
-        # Измененные track файлы: общие файлы с измененными метаданными
-        common_files = current_tracked & previous_tracked
+        # Новые track файлы: сейчас track, но не были в предыдущем состоянии;
+        # измененные - общие файлы с измененными метаданными
+        new_files = set()
         changed_files = set()
-        for file_path in common_files:
-            rel_path = get_relative_path_cached(file_path, self.cfg.src)
-            current_size, current_mtime = get_file_metadata_cached(file_path)
-            stored_meta = self.mirror_state.get(str(rel_path), {})
-            stored_size = stored_meta.get('size', 0)
-            stored_mtime = stored_meta.get('mtime', 0)
+        quick_check_key = self.quick_check_key
+        file_metadata = self.file_metadata
+        for file_path in self.tracked_files:
+            rel_path_str = rel_paths[file_path]
+            if rel_path_str not in previous_tracked:
+                new_files.add(file_path)
+                continue
+            stored = self.mirror_state[rel_path_str][:2]
+            meta = file_metadata[file_path]
             
-            # Проверяем изменение размера или времени модификации (разница > 1 секунды)
-            if (stored_size != current_size or 
-                abs(stored_mtime - current_mtime) > 1.0):
+            # Проверяем изменение размера или времени модификации; точное
+            # совпадение (самый частый случай) проверяется без построения ключей
+            if meta != stored and quick_check_key(*meta) != quick_check_key(*stored):
                 changed_files.add(file_path)
         
+        if self.cfg.verify_content and changed_files:
+            self.content_unchanged_files = self.find_content_unchanged(changed_files)
+            changed_files -= self.content_unchanged_files
+        
         logger.info(f"Changes detected: {len(new_files)} new, {len(changed_files)} changed, {len(deleted_files)} deleted")
         return new_files, changed_files, deleted_files
 
-    def safe_copy(self, src: Path, dst: Path) -> bool:
-        """Безопасное копирование файла"""
+    def find_content_unchanged(self, files: Set[Path]) -> Set[Path]:
+        """Файлы, у которых изменились метаданные, но не содержимое.
+        
+        Хэш считается только для файлов с измененными метаданными и сверяется
+        с сохраненным в mirror_state; у файла без сохраненного хэша содержимое
+        считается измененным, а новый хэш запоминается для следующих запусков.
+        Файл с сохраненным хэшем, у которого изменился размер или начало и конец
+        отличаются от копии в mirror, считается измененным без чтения целиком;
+        его хэш будет вычислен заново при следующем изменении метаданных.
+        """
+        mirror_str = str(self.cfg.dst / "mirror")
+        pairs = []
+        for file_path in files:
+            rel_path_str = self.rel_paths[file_path]
+            stored = self.mirror_state[rel_path_str]
+            size = self.file_metadata[file_path][0]
+            if stored.hash is not None and (
+                    size != stored.size or
+                    samples_differ(str(file_path), os.path.join(mirror_str, rel_path_str), size)):
+                continue
+            pairs.append((file_path, rel_path_str))
+        
+        unchanged = set()
+        # hashlib отпускает GIL на больших блоках, поэтому потоки здесь эффективны
+        executor = self.get_scan_executor()
+        paths = [file_path for file_path, _ in pairs]
+        hashes = executor.map(file_content_hash, paths) if executor is not None else map(file_content_hash, paths)
+        for (file_path, rel_path_str), content_hash in zip(pairs, hashes):
+            if content_hash is None:
+                continue
+            self.content_hashes[rel_path_str] = content_hash
+            if self.mirror_state[rel_path_str].hash == content_hash:
+                unchanged.add(file_path)
+        
+        if unchanged:
+            logger.info(f"Content unchanged for {len(unchanged)} tracked files with changed metadata")
+        return unchanged
+
+    def safe_copy(self, src: Path, dst: str) -> bool:
+        """Безопасное копирование файла (родительская директория должна существовать).
+        
+        Файл пишется во временный файл рядом с dst и атомарно заменяет его через
+        os.replace. Запись поверх dst изменила бы и его hardlink-и в прошлых
+        инкрементах, а прерванное копирование оставило бы в mirror обрезанный файл.
+        """
+        temp_path = temp_copy_path(dst)
         try:
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+            copy_file_contents(src, temp_path)
+            shutil.copystat(src, temp_path)
+            os.replace(temp_path, dst)
             return True
         except Exception as e:
             logger.error(f"Copy failed {src} -> {dst}: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return False
+
+    def set_mirror_mtime(self, mirror_path: str, mtime_ns: int) -> bool:
+        """Установка mtime файла mirror с неизменившимся содержимым.
+        
+        Файл, у которого есть hardlink-и в прошлых инкрементах, заменяется
+        новым inode (клон или копия, затем os.replace): utime на месте изменил
+        бы mtime и в этих инкрементах.
+        """
+        try:
+            if os.stat(mirror_path).st_nlink == 1:
+                os.utime(mirror_path, ns=(mtime_ns, mtime_ns))
+                return True
+        except OSError as e:
+            logger.warning(f"Can't update mtime of {mirror_path}: {e}")
+            return False
+        
+        temp_path = temp_copy_path(mirror_path)
+        try:
+            if not reflink_file(mirror_path, temp_path):
+                copy_file_contents(mirror_path, temp_path)
+            shutil.copystat(mirror_path, temp_path)
+            os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+            os.replace(temp_path, mirror_path)
+            return True
+        except Exception as e:
+            logger.warning(f"Can't update mtime of {mirror_path}: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
             return False
 
+    def copy_batch(self, batch: List[Tuple[Path, str]]) -> List[Tuple[Path, str]]:
+        """Копирование пачки файлов в одном потоке, возвращает неудачные пары"""
+        failed = []
+        for src, dst in batch:
+            if not self.safe_copy(src, dst):
+                failed.append((src, dst))
+        return failed
+
+    def copy_files_parallel(self, files: Set[Tuple[Path, str]]) -> Set[Tuple[Path, str]]:
+        """Многопоточное копирование файлов пачками по COPY_BATCH_SIZE, возвращает неудачные пары"""
+        pairs = list(files)
+        batches = [pairs[i:i + COPY_BATCH_SIZE] for i in range(0, len(pairs), COPY_BATCH_SIZE)]
+        failed = set()
+        
+        # Директории создаем заранее и по одному разу, а не в каждом потоке для каждого файла
+        make_parent_dirs([dst for _, dst in pairs])
+        
+        executor = self.get_copy_executor()
+        future_to_batch = {executor.submit(self.copy_batch, batch): batch for batch in batches}
+        
+        for future in as_completed(future_to_batch):
+            try:
+                for src, dst in future.result():
+                    logger.error(f"Failed to copy {src} to {dst}")
+                    failed.add((src, dst))
+            except Exception as e:
+                logger.error(f"Exception during batch copy ({len(future_to_batch[future])} files): {e}")
+                failed.update(future_to_batch[future])
+        
+        return failed
+
+    def link_batch(self, batch: List[Tuple[str, str]]) -> int:
+        """Hardlink-и (или копии) пачки файлов в одном потоке, возвращает число созданных"""
+        return sum(1 for src, dst in batch if create_hardlink_or_copy(src, dst, make_dirs=False))
+
+    def link_files_parallel(self, pairs: List[Tuple[str, str]]) -> int:
+        """Создание файлов инкремента из mirror пачками по COPY_BATCH_SIZE в пуле
+        копирования, возвращает число созданных файлов"""
+        if not pairs:
+            return 0
+        make_parent_dirs([dst for _, dst in pairs])
+        batches = [pairs[i:i + COPY_BATCH_SIZE] for i in range(0, len(pairs), COPY_BATCH_SIZE)]
+        return sum(self.get_copy_executor().map(self.link_batch, batches))
+
     def create_increment_metadata(self, backup_dir: Path, timestamp: str, 
                                 new_files: Set[Path], changed_files: Set[Path], 
-                                deleted_files: Set[Path]):
-        """Создает метаданные для инкремента"""
-        metadata = {
+                                deleted_files: Set[str]):
+        """Создает метаданные для инкремента.
+        
+        Каталог пишется в файл потоком, по строке на запись, без построения
+        словаря всего каталога и его сериализации целиком.
+        """
+        header = {
             "version": "1.0",
             "backup_type": "incremental",
             "timestamp": datetime.now().isoformat(),
             "backup_name": f"backup_{timestamp}",
-            "file_catalog": {},
-            "summary": {
-                "new_or_changed_tracked": len(new_files) + len(changed_files),
-                "deleted_tracked": len(deleted_files)
-            }
+        }
+        summary = {
+            "new_or_changed_tracked": len(new_files) + len(changed_files),
+            "deleted_tracked": len(deleted_files)
         }
         
-        # Добавляем информацию о файлах
-        for file_path in new_files | changed_files:
-            rel_path = get_relative_path_cached(file_path, self.cfg.src)
-            size, mtime = get_file_metadata_cached(file_path)
-            metadata["file_catalog"][str(rel_path)] = {
-                "size": size,
-                "mtime": mtime,
-                "category": "tracked"
-            }
-        
-        for file_path in deleted_files:
-            rel_path = get_relative_path_cached(file_path, self.cfg.src)
+        def catalog_lines():
+            # Каждая запись сериализуется отдельно: '"путь":{...}' без внешних скобок
+            for file_path in new_files | changed_files:
+                size, mtime_ns = self.file_metadata[file_path]
+                yield dump_json_bytes({self.rel_paths[file_path]: {
+                    "size": size,
+                    "mtime": mtime_ns / NS_PER_SECOND,
+                    "category": "tracked"
+                }}, indent=False)[1:-1]
             # Для удаленных файлов берем информацию из mirror_state
-            if str(rel_path) in self.mirror_state:
-                stored_meta = self.mirror_state[str(rel_path)]
-                metadata["file_catalog"][str(rel_path)] = {
-                    "size": stored_meta.get('size', 0),
-                    "mtime": stored_meta.get('mtime', 0),
-                    "category": "deleted"
-                }
+            for rel_path_str in deleted_files:
+                stored = self.mirror_state.get(rel_path_str)
+                if stored is not None:
+                    yield dump_json_bytes({rel_path_str: {
+                        "size": stored.size,
+                        "mtime": stored.mtime_ns / NS_PER_SECOND,
+                        "category": "deleted"
+                    }}, indent=False)[1:-1]
         
         # Переименовываем meta.json в backup_{timestamp}.json
         metadata_file = backup_dir / f"backup_{timestamp}.json"
         try:
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            with open(metadata_file, 'wb') as f:
+                f.write(b'{\n')
+                for key, value in header.items():
+                    f.write(b'  %s: %s,\n' % (dump_json_bytes(key, indent=False),
+                                               dump_json_bytes(value, indent=False)))
+                f.write(b'  "file_catalog": {')
+                separator = b'\n    '
+                for line in catalog_lines():
+                    f.write(separator)
+                    f.write(line)
+                    separator = b',\n    '
+                if separator != b'\n    ':
+                    f.write(b'\n  ')
+                f.write(b'},\n  "summary": %s\n}\n' % dump_json_bytes(summary, indent=False))
             logger.info(f"Backup metadata saved to {metadata_file}")
         except Exception as e:
             logger.error(f"Error saving metadata: {e}")
 
-    def execute_backup(self) -> Dict[str, Any]:
+    def execute_backup(self) -> BackupStats:
         """Выполнение бэкапа согласно аксиоматическому алгоритму"""
         start_time = time.time()
+        mirror_dir = self.cfg.dst / "mirror"
+        self.load_mirror_state()
         
-        # Строим множества файлов
-        self.build_file_sets()
+        # Строим множества файлов. Один проход по mirror (вместо exists() + stat()
+        # для каждого файла) идет параллельно со сканированием источника:
+        # они не зависят друг от друга и обычно нагружают разные диски
+        # Если в источнике нет файлов для бэкапа, обход mirror прерывается
+        mirror_cancel = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            mirror_future = None
+            if mirror_dir.is_dir():
+                mirror_future = executor.submit(walk_tree, mirror_dir, relative_keys=True,
+                                                executor=self.get_scan_executor(),
+                                                cancel=mirror_cancel)
+            self.build_file_sets()
+            if not self.all_files:
+                mirror_cancel.set()
+                mirror_future = None
+            mirror_files = mirror_future.result() if mirror_future is not None else {}
         
         # Если нет файлов для бэкапа, выходим
         if not self.all_files:
             logger.warning("No files to backup")
-            return {
-                "total_files": 0,
-                "tracked_files": 0,
-                "new_files": 0,
-                "changed_files": 0,
-                "deleted_files": 0,
-                "backup_time": time.time() - start_time
-            }
+            return BackupStats(0, 0, 0, 0, 0, time.time() - start_time)
         
         # Создаем/проверяем mirror директорию
-        mirror_dir = self.cfg.dst / "mirror"
         mirror_dir.mkdir(parents=True, exist_ok=True)
+        quick_check_key = self.quick_check_key
+        file_metadata = self.file_metadata
+        # mirror_files индексирован относительными путями, как и mirror_state;
+        # полные пути собираются строками через os.path.join только для файлов,
+        # с которыми выполняются операции (создание Path заметно дороже)
+        mirror_str = str(mirror_dir)
+        join = os.path.join
+        
+        self.remove_stale_temp_files(mirror_str, mirror_files)
         
         # Определяем изменения для track файлов
         new_files, changed_files, deleted_files = self.get_changes()
         
+        # Содержимое совпадает - в mirror достаточно обновить mtime, без копирования
+        for file_path in self.content_unchanged_files:
+            rel_path_str = self.rel_paths[file_path]
+            if rel_path_str in mirror_files:
+                mirror_path = join(mirror_str, rel_path_str)
+                size, mtime_ns = self.file_metadata[file_path]
+                if self.set_mirror_mtime(mirror_path, mtime_ns):
+                    mirror_files[rel_path_str] = (size, mtime_ns)
+        
+        # Файлы, которых нет в mirror или которые изменились: один проход для
+        # копирования и в ветке инкремента, и в итоговом обновлении mirror
+        # (при точном совпадении метаданных ключи не строятся)
+        files_to_update = set()
+        for file_path, rel_path_str in self.rel_paths.items():
+            meta = file_metadata[file_path]
+            mirror_meta = mirror_files.get(rel_path_str)
+            if mirror_meta != meta and (mirror_meta is None or
+                                        quick_check_key(*meta) != quick_check_key(*mirror_meta)):
+                files_to_update.add((file_path, join(mirror_str, rel_path_str)))
+        
+        # Состояние mirror строится по источнику, а не по итогам копирования,
+        # поэтому за запуск его достаточно построить и сохранить один раз
+        mirror_state_saved = False
+        
         # Создаем инкремент только если есть изменения в track файлах
         if new_files or changed_files or deleted_files:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_dir = self.cfg.dst / f"backup_{timestamp}"
-            backup_dir.mkdir(parents=True, exist_ok=True)
+            # Директория инкремента создается только при добавлении файлов
+            # (вместе с родительскими директориями файлов)
+            files_added = 0
             
             # 1. Обрабатываем удаленные track файлы: создаем hardlink в deleted инкремента
             if deleted_files:
-                deleted_dir = backup_dir / "deleted"
-                deleted_dir.mkdir(parents=True, exist_ok=True)
-                
-                for file_path in deleted_files:
-                    rel_path = get_relative_path_cached(file_path, self.cfg.src)
-                    mirror_path = mirror_dir / rel_path
-                    increment_path = deleted_dir / rel_path
-                    
-                    if mirror_path.exists():
-                        create_hardlink_or_copy(mirror_path, increment_path)
+                deleted_str = str(backup_dir / "deleted")
+                files_added += self.link_files_parallel([
+                    (join(mirror_str, rel_path_str), join(deleted_str, rel_path_str))
+                    for rel_path_str in deleted_files if rel_path_str in mirror_files
+                ])
             
             # 2. Удаляем из mirror файлы, которых нет в all_files
+            # Содержимое mirror известно из mirror_state, повторно его не сканируем
             files_to_remove_from_mirror = set()
-            for rel_path_str in list(self.mirror_state.keys()):
-                mirror_file_path = mirror_dir / rel_path_str
-                if not mirror_file_path.exists():
+            for rel_path_str in self.mirror_state.keys() - self.source_rel_paths:
+                if not is_path_within_root(rel_path_str):
+                    logger.warning(f"Ignoring mirror state entry outside mirror: {rel_path_str}")
                     continue
-                absolute_path = self.cfg.src / rel_path_str
-                if absolute_path not in self.all_files:
-                    files_to_remove_from_mirror.add(mirror_file_path)
-            
-            for mirror_file_path in files_to_remove_from_mirror:
+                mirror_files.pop(rel_path_str, None)
+                mirror_file_path = join(mirror_str, rel_path_str)
+                files_to_remove_from_mirror.add(mirror_file_path)
                 try:
-                    mirror_file_path.unlink()
-                    logger.debug(f"Removed from mirror: {mirror_file_path}")
+                    os.unlink(mirror_file_path)
+                    logger.debug("Removed from mirror: %s", mirror_file_path)
+                except FileNotFoundError:
+                    continue
                 except Exception as e:
                     logger.error(f"Error removing file from mirror: {e}")
             
-            # 3. Копируем новые/измененные файлы в mirror (многопоточное копирование)
-            files_to_copy_to_mirror = set()
-            for file_path in self.all_files:
-                rel_path = get_relative_path_cached(file_path, self.cfg.src)
-                mirror_path = mirror_dir / rel_path
-                
-                # Проверяем, нужно ли копировать файл
-                if not mirror_path.exists():
-                    files_to_copy_to_mirror.add((file_path, mirror_path))
-                else:
-                    # Проверяем, изменился ли файл
-                    current_size, current_mtime = get_file_metadata_cached(file_path)
-                    mirror_size, mirror_mtime = get_file_metadata_cached(mirror_path)
-                    
-                    if (current_size != mirror_size or 
-                        abs(current_mtime - mirror_mtime) > 1.0):
-                        files_to_copy_to_mirror.add((file_path, mirror_path))
+            # Удаляем только те директории, которые могли опустеть после удаления файлов
+            if files_to_remove_from_mirror:
+                remove_empty_parents({Path(p) for p in files_to_remove_from_mirror},
+                                     mirror_dir, self.cfg.preserved_dirs)
             
-            # Многопоточное копирование
-            with ThreadPoolExecutor(max_workers=self.cfg.max_workers) as executor:
-                future_to_copy = {
-                    executor.submit(self.safe_copy, src, dst): (src, dst) 
-                    for src, dst in files_to_copy_to_mirror
-                }
-                
-                for future in as_completed(future_to_copy):
-                    src, dst = future_to_copy[future]
-                    try:
-                        success = future.result()
-                        if not success:
-                            logger.error(f"Failed to copy {src} to {dst}")
-                    except Exception as e:
-                        logger.error(f"Exception during copy {src} to {dst}: {e}")
+            # 3. Копируем новые/измененные файлы в mirror (многопоточное копирование);
+            # неудачные копирования повторяются в итоговом обновлении mirror
+            failed = self.copy_files_parallel(files_to_update)
+            for file_path, _ in files_to_update - failed:
+                mirror_files[self.rel_paths[file_path]] = self.file_metadata[file_path]
+            files_to_update = failed
             
             # 4. Обрабатываем новые/измененные track файлы: создаем hardlink в track инкремента
             if new_files or changed_files:
-                track_dir = backup_dir / "track"
-                track_dir.mkdir(parents=True, exist_ok=True)
-                
-                for file_path in new_files | changed_files:
-                    rel_path = get_relative_path_cached(file_path, self.cfg.src)
-                    mirror_path = mirror_dir / rel_path
-                    increment_path = track_dir / rel_path
-                    
-                    if mirror_path.exists():
-                        create_hardlink_or_copy(mirror_path, increment_path)
+                track_str = str(backup_dir / "track")
+                rel_paths = self.rel_paths
+                files_added += self.link_files_parallel([
+                    (join(mirror_str, rel_paths[file_path]), join(track_str, rel_paths[file_path]))
+                    for file_path in new_files | changed_files if rel_paths[file_path] in mirror_files
+                ])
             
             # 5. Проверяем, не пуст ли инкремент
-            if not any(backup_dir.iterdir()):
-                shutil.rmtree(backup_dir, ignore_errors=True)
-                logger.info(f"Removed empty backup directory: {backup_dir}")
+            if not files_added:
+                # Остаться могут только пустые директории от неудачных копирований
+                if backup_dir.exists():
+                    remove_empty_dirs(backup_dir)
+                logger.info(f"No files added to increment, skipped: {backup_dir}")
             else:
-                # Обновляем состояние mirror
-                self.update_mirror_state()
-                self.save_mirror_state()
-                
-                # Создаем метаданные инкремента
+                # Метаданные создаются до обновления состояния: сведения
+                # об удаленных файлах берутся из прежнего mirror_state
                 self.create_increment_metadata(backup_dir, timestamp, new_files, changed_files, deleted_files)
                 logger.info(f"Created increment: {backup_dir}")
+            
+            # Состояние mirror сохраняется и при пустом инкременте: иначе
+            # обработанные удаления находились бы заново при каждом запуске
+            self.update_mirror_state()
+            self.save_mirror_state()
+            mirror_state_saved = True
         else:
             logger.info("No changes in tracked files, skipping increment creation")
         
         # Если нет инкремента, но есть изменения в include файлах, мы все равно обновляем mirror
-        # Находим файлы, которые нужно обновить в mirror
-        files_to_update = set()
-        for file_path in self.all_files:
-            rel_path = get_relative_path_cached(file_path, self.cfg.src)
-            mirror_path = mirror_dir / rel_path
-            
-            # Проверяем, нужно ли копировать файл
-            if not mirror_path.exists():
-                files_to_update.add((file_path, mirror_path))
-            else:
-                # Проверяем, изменился ли файл
-                current_size, current_mtime = get_file_metadata_cached(file_path)
-                mirror_size, mirror_mtime = get_file_metadata_cached(mirror_path)
-                
-                if (current_size != mirror_size or 
-                    abs(current_mtime - mirror_mtime) > 1.0):
-                    files_to_update.add((file_path, mirror_path))
-        
-        if files_to_update:
+        # Файлам с совпавшим хэшем копирование не нужно, но новый mtime
+        # надо сохранить, иначе хэш будет пересчитываться при каждом запуске
+        if files_to_update or self.content_unchanged_files:
             # Многопоточное копирование
-            with ThreadPoolExecutor(max_workers=self.cfg.max_workers) as executor:
-                future_to_copy = {
-                    executor.submit(self.safe_copy, src, dst): (src, dst) 
-                    for src, dst in files_to_update
-                }
-                
-                for future in as_completed(future_to_copy):
-                    src, dst = future_to_copy[future]
-                    try:
-                        success = future.result()
-                        if not success:
-                            logger.error(f"Failed to copy {src} to {dst}")
-                    except Exception as e:
-                        logger.error(f"Exception during copy {src} to {dst}: {e}")
+            if files_to_update:
+                failed = self.copy_files_parallel(files_to_update)
+                for file_path, _ in files_to_update - failed:
+                    mirror_files[self.rel_paths[file_path]] = self.file_metadata[file_path]
             
-            # Обновляем mirror_state
-            self.update_mirror_state()
-            self.save_mirror_state()
+            # Обновляем mirror_state (если он не сохранен вместе с инкрементом)
+            if not mirror_state_saved:
+                self.update_mirror_state()
+                self.save_mirror_state()
         
+        # Содержимое mirror отслеживается в mirror_files по ходу копирования
+        # и удаления, поэтому для итога повторный обход не нужен
+        logger.info(f"Mirror contains {len(mirror_files)} files")
         logger.info(f"Backup completed in {time.time() - start_time:.2f}s")
-        return {
-            "total_files": len(self.all_files),
-            "tracked_files": len(self.tracked_files),
-            "new_files": len(new_files),
-            "changed_files": len(changed_files),
-            "deleted_files": len(deleted_files),
-            "backup_time": time.time() - start_time
-        }
+        return BackupStats(
+            total_files=len(self.all_files),
+            tracked_files=len(self.tracked_files),
+            new_files=len(new_files),
+            changed_files=len(changed_files),
+            deleted_files=len(deleted_files),
+            backup_time=time.time() - start_time
+        )
+
+    def remove_stale_temp_files(self, mirror_str: str, mirror_files: Dict[str, Tuple[int, int]]):
+        """Удаление временных файлов, оставшихся в mirror от прерванного запуска.
+        
+        Файл с именем временного файла считается остатком, только если его нет
+        ни в источнике, ни в mirror_state: такое имя может быть и у настоящего файла.
+        """
+        match = TEMP_COPY_NAME_RE.match
+        stale = [
+            rel_path_str for rel_path_str in mirror_files
+            if rel_path_str.endswith('.tmp') and match(os.path.basename(rel_path_str)) is not None
+            and rel_path_str not in self.source_rel_paths and rel_path_str not in self.mirror_state
+        ]
+        for rel_path_str in stale:
+            del mirror_files[rel_path_str]
+            temp_path = os.path.join(mirror_str, rel_path_str)
+            try:
+                os.unlink(temp_path)
+                logger.info(f"Removed stale temporary file: {temp_path}")
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Can't remove stale temporary file {temp_path}: {e}")
 
     def update_mirror_state(self):
         """Обновление состояния mirror для всех файлов"""
         new_mirror_state = {}
         
-        for file_path in self.all_files:
+        for file_path, rel_path_str in self.rel_paths.items():
             try:
-                rel_path = get_relative_path_cached(file_path, self.cfg.src)
-                size, mtime = get_file_metadata_cached(file_path)
+                size, mtime_ns = self.file_metadata[file_path]
                 is_tracked = file_path in self.tracked_files
                 
-                new_mirror_state[str(rel_path)] = {
-                    'size': size,
-                    'mtime': mtime,
-                    'tracked': is_tracked
-                }
+                # Хэш переносится, пока метаданные файла не менялись
+                content_hash = self.content_hashes.get(rel_path_str)
+                if content_hash is None:
+                    old = self.mirror_state.get(rel_path_str)
+                    if old is not None and old.size == size and old.mtime_ns == mtime_ns:
+                        content_hash = old.hash
+                
+                new_mirror_state[rel_path_str] = MirrorEntry(size, mtime_ns, is_tracked, content_hash)
             except Exception as e:
                 logger.warning(f"Error updating mirror state for {file_path}: {e}")
         
@@ -691,8 +1749,7 @@ def load_config(config_file: Path) -> BackupConfig:
         logger.info("Please edit the config file and run again")
         sys.exit(0)
     
-    with open(config_file, 'r', encoding='utf-8') as f:
-        config_data = json.load(f)
+    config_data = load_json_file(config_file)
     
     return BackupConfig(
         src=Path(config_data["src"]),
@@ -705,19 +1762,40 @@ def load_config(config_file: Path) -> BackupConfig:
         track_dirs=set(config_data["track_dirs"]),
         track_files=set(config_data["track_files"]),
         preserved_dirs=set(config_data["preserved_dirs"]),
-        max_workers=config_data.get("max_workers", 4)
+        max_workers=config_data.get("max_workers", 4),
+        size_only=config_data.get("size_only", False),
+        mirror_db=config_data.get("mirror_db", False),
+        verify_content=config_data.get("verify_content", False)
     )
 
 # --- Основная функция ---
 
-def main():
-    """Основная функция"""
+@lru_cache(maxsize=None)
+def get_arg_parser() -> argparse.ArgumentParser:
+    """Парсер аргументов командной строки (строится один раз, в том числе
+    при повторных вызовах main)"""
     parser = argparse.ArgumentParser(description="Axiomatic Backup System")
-    parser.add_argument("--config", "-c", default="backup_config.json", help="Configuration file")
+    parser.add_argument("--config", "-c", default=DEFAULT_CONFIG_FILE, help="Configuration file")
     parser.add_argument("--debug", "-d", action="store_true", help="Enable debug logging")
     parser.add_argument("--dry-run", "-n", action="store_true", help="Dry run without actual backup")
+    return parser
+
+def main():
+    """Основная функция"""
+    if len(sys.argv) == 1:
+        # Частый запуск без аргументов (cron, таймеры): разбор не нужен, но значения
+        # по умолчанию берутся из самого парсера, чтобы не разойтись с его аргументами
+        args = argparse.Namespace(**{action.dest: action.default
+                                     for action in get_arg_parser()._actions
+                                     if action.default is not argparse.SUPPRESS})
+    else:
+        args = get_arg_parser().parse_args()
     
-    args = parser.parse_args()
+    # Трассировка всех потоков при аварийном завершении (SIGSEGV, SIGABRT...)
+    # и по сигналу SIGUSR1 от оператора - например, если бэкап завис на ФС
+    faulthandler.enable(file=sys.stderr, all_threads=True)
+    if hasattr(signal, "SIGUSR1"):
+        faulthandler.register(signal.SIGUSR1, all_threads=True, chain=False)
     
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -726,30 +1804,31 @@ def main():
         # Загрузка конфигурации
         cfg = load_config(Path(args.config))
         
-        if args.dry_run:
-            logger.info("Dry run mode - no backup will be performed")
-            # Создаем систему бэкапа только для построения множеств
-            backup_system = AxiomaticBackupSystem(cfg)
-            backup_system.build_file_sets()
-            logger.info(f"Would backup {len(backup_system.all_files)} files")
-            logger.info(f"Would track {len(backup_system.tracked_files)} files")
-            return
-        
-        # Создание системы бэкапа
+        # Создание системы бэкапа (одна на оба режима)
         backup_system = AxiomaticBackupSystem(cfg)
+        try:
+            if args.dry_run:
+                logger.info("Dry run mode - no backup will be performed")
+                # Только подсчет множеств файлов
+                all_count, tracked_count = backup_system.count_file_sets()
+                logger.info("Would backup %d files", all_count)
+                logger.info("Would track %d files", tracked_count)
+                return
+            
+            # Выполнение бэкапа
+            stats = backup_system.execute_backup()
+        finally:
+            backup_system.close()
         
-        # Выполнение бэкапа
-        stats = backup_system.execute_backup()
-        
-        # Вывод статистики
+        # Вывод статистики: строка на запись лога, чтобы у каждой был префикс
         logger.info("=== BACKUP STATISTICS ===")
-        for key, value in stats.items():
-            logger.info(f"{key}: {value}")
+        for key, value in zip(stats._fields, stats):
+            logger.info("%s: %s", key, value)
                 
     except Exception as e:
-        logger.error(f"Backup failed: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Backup failed: %s", e)
+        # Обработчики лога сбрасываются и закрываются до выхода
+        logging.shutdown()
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -9,16 +9,242 @@ import argparse
 import sys
 import re
 import os
+import stat
+import sqlite3
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from itertools import repeat
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Optional, Set, Any, Tuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Any, Tuple, Iterator
 import fnmatch
 import logging
+from functools import lru_cache
+
+try:
+    import orjson  # optional fast JSON parser/serializer
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick  # optional multi-pattern substring matcher (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
+# Below this many substring masks separate 'in' tests are faster than the automaton
+AUTOMATON_MIN_LITERALS = 16
+
+# Persistent search index kept in the backup store (rebuilt per backup when
+# its metadata file changes). Catalogs are stored column-wise, sorted by path:
+# text columns joined with NUL, sizes/mtimes as little-endian int64/float64 arrays
+SEARCH_INDEX_NAME = ".search_index.db"
+SEARCH_INDEX_VERSION = 4
+# Per-backup Bloom filter over byte trigrams of the paths: lets substring searches
+# skip backups that can't contain the text without loading their catalogs
+TRIGRAM_BLOOM_ORDER = 17
+TRIGRAM_BLOOM_BITS = 1 << TRIGRAM_BLOOM_ORDER
+TRIGRAM_WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+SEARCH_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    name TEXT PRIMARY KEY,
+    meta_mtime_ns INTEGER NOT NULL,
+    meta_size INTEGER NOT NULL,
+    backup_timestamp TEXT NOT NULL,
+    mtime_min REAL,
+    mtime_max REAL,
+    size_min INTEGER,
+    size_max INTEGER,
+    trigram_bloom BLOB
+);
+CREATE TABLE IF NOT EXISTS catalogs (
+    backup TEXT PRIMARY KEY,
+    paths TEXT NOT NULL,
+    filenames TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    backup_paths TEXT NOT NULL,
+    sizes BLOB NOT NULL,
+    mtimes BLOB NOT NULL
+);
+"""
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def dump_json_bytes(data: Any) -> bytes:
+    """Serialize data to indented UTF-8 JSON (via orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def iter_json_object_chunks(mapping: Dict[str, Any]) -> Iterator[bytes]:
+    """Serialize a mapping as indented JSON one top-level entry at a time.
+    
+    The concatenated chunks equal dump_json_bytes(mapping); values are nested by
+    re-indenting their lines (raw newlines never occur inside JSON strings).
+    """
+    if not mapping:
+        yield dump_json_bytes(mapping)
+        return
+    separator = b'{\n  '
+    for key, value in mapping.items():
+        yield separator + dump_json_bytes(key) + b': ' + dump_json_bytes(value).replace(b'\n', b'\n  ')
+        separator = b',\n  '
+    yield b'\n}'
+
+@lru_cache(maxsize=256)
+def preprocess_masks(patterns: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Normalize search masks: a mask without wildcards matches as a substring"""
+    processed = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not any(c in pattern for c in '*?[]'):
+            pattern = f"*{pattern}*"
+        processed.append(pattern)
+    return tuple(processed)
+
+def translate_mask(pattern: str, group: int) -> Tuple[str, int]:
+    """Translate a mask into an anchored regex that cannot backtrack catastrophically.
+    
+    Only the first '*' backtracks; later segments between '*' are matched at their
+    leftmost occurrence (which is enough for glob semantics) inside a lookahead +
+    backreference, an atomic group that works on every Python version. This keeps
+    matching quadratic at worst. The groups are named: a numeric backreference
+    from \\100 on would be read as an octal escape. Returns the regex and the
+    next free group number.
+    """
+    def escape(segment: str) -> str:
+        return re.escape(segment).replace(r'\?', '.')
+    
+    parts = pattern.split('*')
+    if len(parts) == 1:
+        return f"^{escape(pattern)}$", group
+    regex = '^' + escape(parts[0])
+    middle = [segment for segment in parts[1:-1] if segment]
+    if middle:
+        regex += f".*{escape(middle[0])}"
+    for segment in middle[1:]:
+        regex += f"(?=(?P<g{group}>.*?{escape(segment)}))(?P=g{group})"
+        group += 1
+    return regex + f".*{escape(parts[-1])}$", group
+
+@lru_cache(maxsize=256)
+def classify_masks(patterns: Tuple[str, ...]) -> Tuple[Tuple[str, ...], ...]:
+    """Split preprocessed masks into plain string tests and real globs.
+    
+    Returns (substrings, prefixes, suffixes, globs): '*text*', 'text*' and '*text'
+    masks without other wildcards are checked with str operations, the rest
+    goes to the regex.
+    """
+    substrings, prefixes, suffixes, globs = [], [], [], []
+    for pattern in patterns:
+        stars = pattern.count('*')
+        if '?' in pattern or not stars:
+            globs.append(pattern)
+        elif stars == 2 and len(pattern) >= 2 and pattern[0] == pattern[-1] == '*':
+            substrings.append(pattern[1:-1])
+        elif stars == 1 and pattern[-1] == '*':
+            prefixes.append(pattern[:-1])
+        elif stars == 1 and pattern[0] == '*':
+            suffixes.append(pattern[1:])
+        else:
+            globs.append(pattern)
+    return tuple(substrings), tuple(prefixes), tuple(suffixes), tuple(globs)
+
+@lru_cache(maxsize=256)
+def build_literal_automaton(literals: Tuple[str, ...]) -> Optional[Any]:
+    """Aho-Corasick automaton over substring masks: one pass over the text finds
+    any of them (None when pyahocorasick is missing or there are few masks)"""
+    if ahocorasick is None or len(literals) < AUTOMATON_MIN_LITERALS or '' in literals:
+        return None
+    automaton = ahocorasick.Automaton()
+    for literal in literals:
+        automaton.add_word(literal, literal)
+    automaton.make_automaton()
+    return automaton
+
+@lru_cache(maxsize=256)
+def compile_masks(patterns: Tuple[str, ...]) -> re.Pattern:
+    """Compile preprocessed masks into a single regex (memoized per mask set)"""
+    regex_parts = []
+    group = 1
+    for pattern in patterns:
+        regex, group = translate_mask(pattern, group)
+        regex_parts.append(regex)
+    
+    combined = '|'.join(regex_parts)
+    return re.compile(combined)
+
+def load_json_bytes(data: bytes) -> Any:
+    """Parse JSON from bytes (via orjson when installed)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with prefix
+    (None if there is no such bound)"""
+    last = ord(prefix[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        last = 0xE000  # surrogates are not valid in UTF-8 text
+    if last > 0x10FFFF:
+        return None
+    return prefix[:-1] + chr(last)
+
+def trigram_bloom_positions(trigram: int) -> Tuple[int, int]:
+    """Bit positions of a 24-bit trigram in the Bloom filter (two multiplicative hashes)"""
+    shift = 32 - TRIGRAM_BLOOM_ORDER
+    return ((trigram * 0x9E3779B1) & 0xFFFFFFFF) >> shift, ((trigram * 0x85EBCA6B) & 0xFFFFFFFF) >> shift
+
+def build_trigram_bloom(texts: Tuple[str, ...]) -> bytes:
+    """Bloom filter of all byte trigrams occurring in the texts.
+    
+    The UTF-8 bytes are read as little-endian 32-bit words at every offset, so the
+    low and high three bytes of the words give all trigrams without a Python-level
+    loop over the text.
+    """
+    words = set()
+    for text in texts:
+        data = text.encode('utf-8', 'surrogatepass') + b'\0'
+        for offset in range(4):
+            chunk = array(TRIGRAM_WORD_TYPECODE, data[offset:offset + (len(data) - offset) // 4 * 4])
+            if sys.byteorder != 'little':
+                chunk.byteswap()
+            words.update(chunk)
+    bits = bytearray(TRIGRAM_BLOOM_BITS // 8)
+    for trigram in {word & 0xFFFFFF for word in words} | {word >> 8 for word in words}:
+        for position in trigram_bloom_positions(trigram):
+            bits[position >> 3] |= 1 << (position & 7)
+    return bytes(bits)
+
+@lru_cache(maxsize=256)
+def mask_bloom_positions(literals: Tuple[str, ...]) -> Optional[Tuple[Tuple[int, ...], ...]]:
+    """Bloom bit positions of every trigram of each literal mask
+    (None if some literal is shorter than a trigram and can't be checked)"""
+    result = []
+    for literal in literals:
+        data = literal.encode('utf-8', 'surrogatepass')
+        if len(data) < 3:
+            return None
+        positions = set()
+        for i in range(len(data) - 2):
+            positions.update(trigram_bloom_positions(data[i] | data[i + 1] << 8 | data[i + 2] << 16))
+        result.append(tuple(sorted(positions)))
+    return tuple(result)
+
+def split_extension(file_name: str) -> Tuple[str, str]:
+    """Split file name into stem and suffix the way pathlib does"""
+    dot = file_name.rfind('.')
+    if 0 < dot < len(file_name) - 1:
+        return file_name[:dot], file_name[dot:]
+    return file_name, ''
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+# Suffixes accepted by the size filter
+SIZE_MULTIPLIERS = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+
 # Color codes for terminal output
 class Colors:
     RED = '\033[91m'
@@ -32,6 +258,15 @@ class Colors:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
+# Row color and status mark by file category (anything else is shown as deleted)
+CATEGORY_STYLES = {
+    "track": (Colors.GREEN, "✅"),
+    "tracked": (Colors.GREEN, "✅"),
+}
+DELETED_STYLE = (Colors.RED, "❌")
+TRACKED_CATEGORIES = frozenset(("track", "tracked"))
+DELETED_CATEGORIES = frozenset(("delete", "deleted"))
+
 class BackupExplorer:
     def __init__(self, backup_dir: Path):
         self.backup_dir = Path(backup_dir)
@@ -40,21 +275,21 @@ class BackupExplorer:
         
         # Cache for metadata to avoid repeated file reads
         self.metadata_cache = {}
-    
+        # Search index connection: None - not opened yet, False - unavailable
+        self.search_index = None
+        # Last backup list and the backup_dir mtime it was scanned at
+        self.backups_cache = None
+
     def format_size(self, size_bytes: int) -> str:
         """Format file size into human-readable form"""
         if size_bytes == 0:
             return "0 B"
         
-        units = ['B', 'KB', 'MB', 'GB', 'TB']
+        # Unit picked from the bit length: each unit is 2**10 of the previous one
         i = 0
-        size = float(size_bytes)
-        
-        while size >= 1024 and i < len(units) - 1:
-            size /= 1024.0
-            i += 1
-        
-        return f"{size:.1f} {units[i]}"
+        if size_bytes >= 1024:
+            i = min((int(size_bytes).bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+        return f"{size_bytes / (1 << (i * 10)):.1f} {SIZE_UNITS[i]}"
     
     def format_timestamp_display(self, timestamp: str) -> str:
         """Format timestamp for display (date and time)"""
@@ -65,13 +300,25 @@ class BackupExplorer:
             return timestamp
     
     def find_all_backups(self) -> List[Path]:
-        """Find all backup folders of the new format"""
+        """Find all backup folders of the new format (rescanned when backup_dir changes)"""
+        try:
+            dir_mtime = self.backup_dir.stat().st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if self.backups_cache is not None and dir_mtime is not None and self.backups_cache[0] == dir_mtime:
+            return list(self.backups_cache[1])
+        
         backups = []
-        for item in self.backup_dir.iterdir():
-            if item.is_dir() and item.name.startswith('backup_'):
-                if (item / "track").exists() or (item / "deleted").exists():
-                    backups.append(item)
-        return sorted(backups, key=lambda x: x.stat().st_mtime)
+        with os.scandir(self.backup_dir) as it:
+            for entry in it:
+                if entry.name.startswith('backup_') and entry.is_dir():
+                    if (os.path.exists(os.path.join(entry.path, "track")) or
+                            os.path.exists(os.path.join(entry.path, "deleted"))):
+                        backups.append((entry.stat().st_mtime, entry.path))
+        backups.sort(key=lambda item: item[0])
+        backups = [Path(path) for _, path in backups]
+        self.backups_cache = (dir_mtime, backups)
+        return list(backups)
     
     def load_metadata(self, backup_path: Path, use_cache: bool = True) -> Optional[Dict]:
         """Load metadata of a backup in new format with caching"""
@@ -84,15 +331,171 @@ class BackupExplorer:
             return None
         
         try:
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
+            with open(metadata_file, 'rb') as f:
+                metadata = load_json_bytes(f.read())
+                self._normalize_catalog(metadata)
                 if use_cache:
                     self.metadata_cache[backup_str] = metadata
                 return metadata
-        except (json.JSONDecodeError, IOError) as e:
+        except (ValueError, IOError) as e:
             logger.warning(f"Error loading metadata for {backup_path.name}: {e}")
             return None
     
+    def preload_metadata(self, backups: List[Path]):
+        """Load metadata of several backups into the cache concurrently.
+        
+        Reading many small files is latency-bound, so the reads are overlapped
+        in a thread pool; callers then get the cached copies in their own order.
+        """
+        missing = [backup_path for backup_path in backups if str(backup_path) not in self.metadata_cache]
+        if len(missing) > 1:
+            with ThreadPoolExecutor() as executor:
+                for _ in executor.map(self.load_metadata, missing):
+                    pass
+    
+    def _normalize_catalog(self, metadata: Any):
+        """Fill path-derived catalog fields once per load, so the cached metadata
+        is in canonical form (recreated metadata already stores them)"""
+        if not isinstance(metadata, dict) or not isinstance(metadata.get("file_catalog"), dict):
+            return
+        for file_path, file_info in metadata["file_catalog"].items():
+            if "filename" not in file_info:
+                file_info["filename"] = file_path.rpartition('/')[2]
+            if "backup_path" not in file_info:
+                file_info["backup_path"] = f"{file_info.get('category', 'track')}/{file_path}"
+    
+    def open_search_index(self) -> Optional[sqlite3.Connection]:
+        """Open (creating if needed) the persistent search index of the backup store"""
+        if self.search_index is None:
+            try:
+                conn = sqlite3.connect(str(self.backup_dir / SEARCH_INDEX_NAME))
+                if conn.execute("PRAGMA user_version").fetchone()[0] != SEARCH_INDEX_VERSION:
+                    # Index of an older layout: it is only a cache, rebuild from scratch
+                    conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS catalogs; "
+                                       "DROP TABLE IF EXISTS backups;")
+                    conn.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+                conn.executescript(SEARCH_INDEX_SCHEMA)
+                self.search_index = conn
+            except sqlite3.Error as e:
+                logger.warning(f"Search index unavailable, reading metadata files: {e}")
+                self.search_index = False
+        return self.search_index or None
+    
+    def _index_backup(self, conn: sqlite3.Connection, backup_path: Path) -> Optional[Tuple]:
+        """Bring the index entry of a backup up to date with its metadata file.
+        
+        Returns the backup summary (timestamp, mtime_min, mtime_max, size_min, size_max),
+        or None if the backup has no usable metadata. Ranges are None for an empty catalog.
+        """
+        metadata_file = backup_path / f"{backup_path.name}.json"
+        try:
+            st = metadata_file.stat()
+        except OSError:
+            return None
+        row = conn.execute("SELECT meta_mtime_ns, meta_size, backup_timestamp, mtime_min, mtime_max, "
+                           "size_min, size_max FROM backups WHERE name = ?", (backup_path.name,)).fetchone()
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            return row[2:]
+        
+        metadata = self.load_metadata(backup_path)
+        if not metadata or "file_catalog" not in metadata:
+            return None
+        file_catalog = metadata["file_catalog"]
+        paths = sorted(file_catalog)
+        infos = [file_catalog[file_path] for file_path in paths]
+        sizes = array('q', [file_info["size"] for file_info in infos])
+        mtimes = array('d', [file_info["mtime"] for file_info in infos])
+        summary = (metadata.get('backup_timestamp', ''),
+                   min(mtimes, default=None), max(mtimes, default=None),
+                   min(sizes, default=None), max(sizes, default=None))
+        if sys.byteorder != 'little':
+            sizes.byteswap()
+            mtimes.byteswap()
+        filenames = [file_info["filename"] for file_info in infos]
+        columns = ('\0'.join(paths),
+                   '\0'.join(filenames),
+                   '\0'.join([file_info.get("category", "track") for file_info in infos]),
+                   '\0'.join([file_info["backup_path"] for file_info in infos]),
+                   sizes.tobytes(), mtimes.tobytes())
+        # File names are normally the tails of the paths and add no trigrams
+        bloom_texts = columns[:1] if all(map(str.endswith, paths, filenames)) else columns[:2]
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (backup_path.name,) + columns)
+            conn.execute("INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (backup_path.name, st.st_mtime_ns, st.st_size) + summary +
+                         (build_trigram_bloom(bloom_texts),))
+        return summary
+    
+    def _may_contain(self, conn: sqlite3.Connection, backup_path: Path,
+                     mask_positions: Tuple[Tuple[int, ...], ...]) -> bool:
+        """Check the trigram Bloom filter of a backup: False means no entry contains
+        any of the literals, True means some might"""
+        row = conn.execute("SELECT trigram_bloom FROM backups WHERE name = ?", (backup_path.name,)).fetchone()
+        if row is None or row[0] is None:
+            return True
+        bloom = row[0]
+        return any(all(bloom[position >> 3] >> (position & 7) & 1 for position in positions)
+                   for positions in mask_positions)
+    
+    def _stale_backups(self, conn: sqlite3.Connection, backups: List[Path]) -> List[Path]:
+        """Backups whose index entry is missing or older than their metadata file"""
+        indexed = dict((name, (mtime_ns, size)) for name, mtime_ns, size in
+                       conn.execute("SELECT name, meta_mtime_ns, meta_size FROM backups"))
+        stale = []
+        for backup_path in backups:
+            try:
+                st = (backup_path / f"{backup_path.name}.json").stat()
+            except OSError:
+                continue
+            if indexed.get(backup_path.name) != (st.st_mtime_ns, st.st_size):
+                stale.append(backup_path)
+        return stale
+    
+    def _indexed_catalog(self, conn: sqlite3.Connection, backup_path: Path, path_prefix: Optional[str],
+                         size_bounds: Optional[Tuple[float, float]] = None,
+                         time_bounds: Optional[Tuple[float, float]] = None
+                         ) -> Iterator[Tuple[str, int, float, str, str, str]]:
+        """Catalog entries of a backup from the index.
+        
+        The path prefix is applied by binary search over the sorted paths; size and
+        time bounds are applied column-wise, so only surviving rows are assembled.
+        """
+        row = conn.execute("SELECT paths, filenames, categories, backup_paths, sizes, mtimes "
+                           "FROM catalogs WHERE backup = ?", (backup_path.name,)).fetchone()
+        if row is None:
+            return iter(())
+        paths, filenames, categories, entry_paths, size_bytes, mtime_bytes = row
+        paths = paths.split('\0')
+        sizes, mtimes = array('q'), array('d')
+        sizes.frombytes(size_bytes)
+        mtimes.frombytes(mtime_bytes)
+        if sys.byteorder != 'little':
+            sizes.byteswap()
+            mtimes.byteswap()
+        start, end = 0, len(paths)
+        if path_prefix:
+            start = bisect_left(paths, path_prefix)
+            upper = prefix_upper_bound(path_prefix)
+            if upper is not None:
+                end = bisect_left(paths, upper)
+        if size_bounds is None and time_bounds is None:
+            return zip(paths[start:end], sizes[start:end], mtimes[start:end],
+                       filenames.split('\0')[start:end], categories.split('\0')[start:end],
+                       entry_paths.split('\0')[start:end])
+        
+        rows = range(start, end)
+        if size_bounds is not None:
+            min_size, max_size = size_bounds
+            rows = [i for i in rows if min_size <= sizes[i] <= max_size]
+        if time_bounds is not None:
+            min_mtime, max_mtime = time_bounds
+            rows = [i for i in rows if min_mtime <= mtimes[i] < max_mtime]
+        if not rows:
+            return iter(())
+        columns = (paths, sizes, mtimes, filenames.split('\0'), categories.split('\0'), entry_paths.split('\0'))
+        return zip(*[[column[i] for i in rows] for column in columns])
+    
     def clear_metadata_cache(self):
         """Clear the metadata cache"""
         self.metadata_cache = {}
@@ -104,34 +507,32 @@ class BackupExplorer:
         if metadata_file.exists() and not force:
             logger.info(f"Metadata already exists for {backup_path.name}, use --force to overwrite")
             return False
+        self.backups_cache = None
         
         file_catalog = {}
         statistics = {"total_files": 0, "total_size": 0}
+        counts = {"track": 0, "deleted": 0}
         
-        for category in ["track", "deleted"]:
-            category_dir = backup_path / category
-            if category_dir.exists():
-                for file_path in category_dir.rglob('*'):
-                    if file_path.is_file():
-                        try:
-                            rel_path = str(file_path.relative_to(category_dir))
-                            
-                            file_catalog[rel_path] = {
-                                "size": file_path.stat().st_size,
-                                "mtime": file_path.stat().st_mtime,
-                                "mtime_iso": datetime.fromtimestamp(file_path.stat().st_mtime).isoformat(),
-                                "mtime_date": datetime.fromtimestamp(file_path.stat().st_mtime).strftime("%Y-%m-%d"),
-                                "category": category,
-                                "backup_path": f"{category}/{rel_path}"
-                            }
-                            
-                            statistics["total_files"] += 1
-                            statistics["total_size"] += file_path.stat().st_size
-                        except Exception as e:
-                            logger.warning(f"Error processing file {file_path}: {e}")
-        
-        track_count = sum(1 for info in file_catalog.values() if info["category"] == "track")
-        deleted_count = sum(1 for info in file_catalog.values() if info["category"] == "deleted")
+        # Stat calls are latency-bound (HDD, network FS): overlap them in a thread pool
+        with ThreadPoolExecutor() as executor:
+            for category in ["track", "deleted"]:
+                category_dir = backup_path / category
+                if not category_dir.exists():
+                    continue
+                files = list(self._iter_category_files(str(category_dir)))
+                entries = executor.map(self._describe_file, files, repeat(category))
+                for entry in entries:
+                    if entry is None:
+                        continue
+                    rel_path, info = entry
+                    file_catalog[rel_path] = info
+                    counts[category] += 1
+                    statistics["total_size"] += info["size"]
+        
+        # Categories are counted in the scan itself, the total follows from them
+        track_count = counts["track"]
+        deleted_count = counts["deleted"]
+        statistics["total_files"] = track_count + deleted_count
         
         metadata = {
             "version": "1.0",
@@ -151,8 +552,8 @@ class BackupExplorer:
         }
         
         try:
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            with open(metadata_file, 'wb') as f:
+                f.write(dump_json_bytes(metadata))
             # Update cache
             self.metadata_cache[str(backup_path)] = metadata
             logger.info(f"Metadata recreated for {backup_path.name}")
@@ -161,151 +562,203 @@ class BackupExplorer:
             logger.error(f"Error saving metadata for {backup_path.name}: {e}")
             return False
     
+    def _iter_category_files(self, category_dir: str) -> Iterator[Tuple[str, str]]:
+        """Walk a backup category with os.scandir: yields (file path, relative path).
+        
+        File types come from the directory entries, so no stat or Path object
+        is needed per entry; symlinked directories are not followed (as rglob).
+        """
+        prefix_len = len(os.path.join(category_dir, ''))
+        stack = [category_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            yield entry.path, entry.path[prefix_len:]
+            except OSError as e:
+                logger.warning(f"Can't scan directory {current}: {e}")
+    
+    def _describe_file(self, file: Tuple[str, str], category: str) -> Optional[Tuple[str, Dict]]:
+        """Catalog entry for one (path, relative path) of a backup category (a single stat call)"""
+        file_path, rel_path = file
+        try:
+            st = os.stat(file_path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            mtime_dt = datetime.fromtimestamp(st.st_mtime)
+            return rel_path, {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "mtime_iso": mtime_dt.isoformat(),
+                "mtime_date": mtime_dt.strftime("%Y-%m-%d"),
+                "category": category,
+                "backup_path": f"{category}/{rel_path}",
+                "filename": os.path.basename(file_path)
+            }
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Error processing file {file_path}: {e}")
+            return None
+    
     def recreate_all_metadata(self, force: bool = False):
         """Recreate metadata for all incremental backups of the new format"""
         backups = self.find_all_backups()
         logger.info(f"Found {len(backups)} backups to process")
         
-        success_count = 0
+        # Backups are independent: recreate them in worker processes, so the stat
+        # latency and JSON serialization of different backups overlap
+        results: Dict[Path, bool] = {}
+        if len(backups) > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(len(backups), os.cpu_count() or 1)) as executor:
+                    futures = {
+                        executor.submit(recreate_backup_metadata, str(self.backup_dir), str(backup_path), force):
+                            backup_path
+                        for backup_path in backups
+                    }
+                    for future in as_completed(futures):
+                        results[futures[future]] = future.result()
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"Process pool failed, recreating remaining metadata sequentially: {e}")
+            # Metadata was written by the workers: drop cached copies
+            for backup_path in backups:
+                self.metadata_cache.pop(str(backup_path), None)
+            self.backups_cache = None
+        # Only backups the pool did not finish are processed here: rerunning a
+        # finished one without force would report it as failed
         for backup_path in backups:
-            if self.recreate_metadata(backup_path, force):
-                success_count += 1
+            if backup_path not in results:
+                results[backup_path] = self.recreate_metadata(backup_path, force)
+        success_count = sum(1 for success in results.values() if success)
         
         logger.info(f"Successfully recreated metadata for {success_count}/{len(backups)} backups")
     
     def _compile_regex_patterns(self, patterns: List[str]) -> re.Pattern:
         """Compile file masks into a single regex for faster search"""
-        regex_parts = []
-        for pattern in patterns:
-            # Escape special characters except * and ?
-            escaped = re.escape(pattern)
-            escaped = escaped.replace(r'\*', '.*').replace(r'\?', '.')
-            regex_parts.append(f"^{escaped}$")
-        
-        combined = '|'.join(regex_parts)
-        return re.compile(combined)
+        return compile_masks(tuple(patterns))
     
     def _preprocess_patterns(self, patterns: List[str]) -> List[str]:
         """Preprocess patterns"""
-        processed = []
-        for pattern in patterns:
-            pattern = pattern.strip()
-            if not any(c in pattern for c in '*?[]'):
-                pattern = f"*{pattern}*"
-            processed.append(pattern)
-        return processed
+        return list(preprocess_masks(tuple(patterns)))
     
     def _validate_time_filter(self, time_filter: str) -> bool:
         """Validate time filter"""
+        if not time_filter or self._parse_time_filter(time_filter) is not None:
+            return True
+        print(f"⚠️  Invalid date format: {time_filter}")
+        return False
+    
+    def _parse_day(self, date_str: str) -> datetime:
+        """Parse a YYYY-MM-DD date; the canonical form is sliced directly,
+        strptime is only needed for its lenient variants (e.g. 2024-1-5)"""
+        if (len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-' and max(date_str) <= '9'
+                and (date_str[:4] + date_str[5:7] + date_str[8:]).isdigit()):
+            return datetime(int(date_str[:4]), int(date_str[5:7]), int(date_str[8:]))
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    
+    def _parse_time_filter(self, time_filter: str) -> Optional[Tuple[float, float]]:
+        """Convert time filter into [min_ts, max_ts) bounds of local-day mtimes"""
+        def day_start(date_str: str) -> float:
+            return self._parse_day(date_str).timestamp()
+        
+        def day_end(date_str: str) -> float:
+            day = self._parse_day(date_str)
+            if day.date() == day.date().max:
+                return float('inf')
+            return (day + timedelta(days=1)).timestamp()
+        
         try:
-            if not time_filter:
-                return True
-                
             if '..' in time_filter:
-                start, end = time_filter.split('..', 1)
-                datetime.strptime(start, "%Y-%m-%d")
-                datetime.strptime(end, "%Y-%m-%d")
-                return True
-                
-            elif time_filter.startswith(('<', '>')):
-                date_part = time_filter[1:]
-                datetime.strptime(date_part, "%Y-%m-%d")
-                return True
-                
+                start_date, end_date = time_filter.split('..', 1)
+                return day_start(start_date), day_end(end_date)
+            elif time_filter.startswith('<'):
+                return float('-inf'), day_end(time_filter[1:])
+            elif time_filter.startswith('>'):
+                return day_start(time_filter[1:]), float('inf')
             else:
-                datetime.strptime(time_filter, "%Y-%m-%d")
-                return True
-                
-        except ValueError:
-            print(f"⚠️  Invalid date format: {time_filter}")
-            return False
+                return day_start(time_filter), day_end(time_filter)
+        except (ValueError, OverflowError, OSError):
+            return None
     
     def _check_time_filter(self, file_mtime: float, time_filter: str) -> bool:
         """Check if file matches time filter"""
         if not time_filter:
             return True
-            
-        try:
-            file_dt = datetime.fromtimestamp(file_mtime)
-            file_date_obj = file_dt.date()
-            
-            if re.match(r'^\d{4}-\d{2}-\d{2}$', time_filter):
-                target_dt = datetime.strptime(time_filter, "%Y-%m-%d")
-                return file_date_obj == target_dt.date()
-            
-            elif time_filter.startswith('<'):
-                target_date = time_filter[1:]
-                if re.match(r'^\d{4}-\d{2}-\d{2}$', target_date):
-                    target_dt = datetime.strptime(target_date, "%Y-%m-%d")
-                    return file_date_obj <= target_dt.date()
-            
-            elif time_filter.startswith('>'):
-                target_date = time_filter[1:]
-                if re.match(r'^\d{4}-\d{2}-\d{2}$', target_date):
-                    target_dt = datetime.strptime(target_date, "%Y-%m-%d")
-                    return file_date_obj >= target_dt.date()
-            
-            elif '..' in time_filter:
-                start_date, end_date = time_filter.split('..', 1)
-                if (re.match(r'^\d{4}-\d{2}-\d{2}$', start_date) and 
-                    re.match(r'^\d{4}-\d{2}-\d{2}$', end_date)):
-                    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                    return start_dt.date() <= file_date_obj <= end_dt.date()
-            
-            return False
-            
-        except (ValueError, TypeError):
-            return False
+        bounds = self._parse_time_filter(time_filter)
+        return bounds is not None and bounds[0] <= file_mtime < bounds[1]
     
-    def _check_size_filter(self, size: int, size_filter: str) -> bool:
-        """Check if file matches size filter"""
-        if not size_filter:
-            return True
-            
+    def _parse_size_filter(self, size_filter: str) -> Tuple[float, float]:
+        """Convert size filter into inclusive [min_size, max_size] bounds"""
         try:
             if size_filter.startswith('>'):
-                min_size = self._parse_size(size_filter[1:])
-                return size > min_size
+                return self._parse_size(size_filter[1:]) + 1, float('inf')
             elif size_filter.startswith('<'):
-                max_size = self._parse_size(size_filter[1:])
-                return size < max_size
+                return float('-inf'), self._parse_size(size_filter[1:]) - 1
             elif '-' in size_filter:
                 min_str, max_str = size_filter.split('-', 1)
-                min_size = self._parse_size(min_str)
-                max_size = self._parse_size(max_str)
-                return min_size <= size <= max_size
+                return self._parse_size(min_str), self._parse_size(max_str)
             else:
                 target_size = self._parse_size(size_filter)
-                return size == target_size
-        except:
-            return False
+                return target_size, target_size
+        except (ValueError, OverflowError):
+            # Unparsable filter matches nothing
+            return float('inf'), float('-inf')
+    
+    def _check_size_filter(self, size: int, size_filter: str) -> bool:
+        """Check if file matches size filter"""
+        if not size_filter:
+            return True
+        min_size, max_size = self._parse_size_filter(size_filter)
+        return min_size <= size <= max_size
     
     def _parse_size(self, size_str: str) -> int:
         """Parse size string with suffixes"""
         size_str = size_str.strip().upper()
-        if size_str.endswith('K'):
-            return int(float(size_str[:-1]) * 1024)
-        elif size_str.endswith('M'):
-            return int(float(size_str[:-1]) * 1024 * 1024)
-        elif size_str.endswith('G'):
-            return int(float(size_str[:-1]) * 1024 * 1024 * 1024)
-        else:
-            return int(size_str)
+        multiplier = SIZE_MULTIPLIERS.get(size_str[-1:])
+        if multiplier:
+            return int(float(size_str[:-1]) * multiplier)
+        return int(size_str)
     
     def search_files(self, patterns: List[str], size_filter: Optional[str] = None,
                     time_filter: Optional[str] = None, path_prefix: Optional[str] = None,
                     last_backups: Optional[int] = None) -> Dict:
         """Intelligent search for files in backups"""
         
-        processed_patterns = self._preprocess_patterns(patterns)
+        # Mask preprocessing, classification and compilation are memoized per mask tuple
+        processed_patterns = preprocess_masks(tuple(patterns))
         
-        if time_filter and not self._validate_time_filter(time_filter):
+        # Time filter is compared as plain timestamps: parse (and validate) it once per search
+        time_bounds = self._parse_time_filter(time_filter) if time_filter else None
+        if time_filter and time_bounds is None:
+            print(f"⚠️  Invalid date format: {time_filter}")
             print("⚠️  Search will continue without time filter")
-            time_filter = None
+        if time_bounds is not None:
+            min_mtime, max_mtime = time_bounds
+        size_bounds = self._parse_size_filter(size_filter) if size_filter else None
+        if size_bounds is not None:
+            min_size, max_size = size_bounds
         
-        # Compile regex for fast search
-        regex = self._compile_regex_patterns(processed_patterns)
+        # Substring/prefix/suffix masks are plain str tests, only real globs go through the regex
+        literals, prefixes, suffixes, globs = classify_masks(processed_patterns)
+        regex = None
+        if globs or not (literals or prefixes or suffixes):
+            regex = compile_masks(globs)
+        # Every match contains one of the literals: backups lacking their trigrams are skipped
+        mask_positions = None
+        if regex is None:
+            mask_positions = mask_bloom_positions(literals + prefixes + suffixes)
+        # Many substring masks: a single automaton scan instead of one test per mask
+        automaton = build_literal_automaton(literals)
+        if automaton is not None:
+            literals = ()
+        # A glob starting with '*' that matches a suffix of the path matches the path too,
+        # so the file name needs its own regex pass only when it isn't the path's tail
+        name_suffix_implied = all(glob.startswith('*') for glob in globs)
         
         results = {}
         all_backups = self.find_all_backups()
@@ -315,49 +768,95 @@ class BackupExplorer:
         else:
             backups = all_backups
         
+        index = self.open_search_index()
+        # Metadata files are parsed only where the index can't answer
+        try:
+            to_load = backups if index is None else self._stale_backups(index, backups)
+        except sqlite3.Error:
+            to_load = backups
+        self.preload_metadata(to_load)
         for backup_path in backups:
-            metadata = self.load_metadata(backup_path)
-            if not metadata or "file_catalog" not in metadata:
-                continue
+            catalog = None
+            if index is not None:
+                try:
+                    summary = self._index_backup(index, backup_path)
+                    if summary is None:
+                        continue
+                    backup_timestamp, mtime_min, mtime_max, size_min, size_max = summary
+                    # Backup summary: skip backups without files in the requested range
+                    if mtime_min is None:
+                        continue
+                    if time_bounds is not None and (mtime_max < min_mtime or mtime_min >= max_mtime):
+                        continue
+                    if size_bounds is not None and (size_max < min_size or size_min > max_size):
+                        continue
+                    if mask_positions is not None and not self._may_contain(index, backup_path, mask_positions):
+                        continue
+                    catalog = self._indexed_catalog(index, backup_path, path_prefix, size_bounds, time_bounds)
+                except sqlite3.Error as e:
+                    # Read-only or damaged store: search the metadata files directly
+                    logger.warning(f"Search index unavailable, reading metadata files: {e}")
+                    self.search_index = False
+                    index = None
+            if catalog is None:
+                metadata = self.load_metadata(backup_path)
+                if not metadata or "file_catalog" not in metadata:
+                    continue
+                backup_timestamp = metadata.get('backup_timestamp', '')
+                catalog = ((file_path, file_info["size"], file_info["mtime"], file_info["filename"],
+                            file_info.get("category", "track"), file_info["backup_path"])
+                           for file_path, file_info in metadata["file_catalog"].items())
             
             backup_results = []
-            for file_path, file_info in metadata["file_catalog"].items():
-                # Backward compatibility
-                file_info.setdefault("backup_path", f"{file_info.get('category', 'track')}/{file_path}")
-                file_info.setdefault("mtime_iso", datetime.fromtimestamp(file_info["mtime"]).isoformat())
-                file_info.setdefault("mtime_date", datetime.fromtimestamp(file_info["mtime"]).strftime("%Y-%m-%d"))
-                file_info.setdefault("filename", Path(file_path).name)
-                
-                # Filters
+            for file_path, size, mtime, filename, category, entry_path in catalog:
+                # Filters (cheap checks on raw catalog fields first)
                 if path_prefix and not file_path.startswith(path_prefix):
                     continue
-                if size_filter and not self._check_size_filter(file_info["size"], size_filter):
+                if size_bounds is not None and not min_size <= size <= max_size:
                     continue
-                if time_filter and not self._check_time_filter(file_info["mtime"], time_filter):
-                    continue
-                
-                # Regex search
-                if not (regex.search(file_path) or regex.search(file_info["filename"])):
+                if time_bounds is not None and not min_mtime <= mtime < max_mtime:
                     continue
+
+                # Mask search
+                if suffixes and (file_path.endswith(suffixes) or filename.endswith(suffixes)):
+                    pass
+                elif prefixes and (file_path.startswith(prefixes) or filename.startswith(prefixes)):
+                    pass
+                elif automaton is not None and (any(automaton.iter(file_path)) or (
+                        not file_path.endswith(filename) and any(automaton.iter(filename)))):
+                    pass
+                else:
+                    for literal in literals:
+                        if literal in file_path or literal in filename:
+                            break
+                    else:
+                        if regex is None:
+                            continue
+                        if not regex.search(file_path) and (
+                                (name_suffix_implied and file_path.endswith(filename)) or
+                                not regex.search(filename)):
+                            continue
                 
+                # Display fields are derived from mtime only for matches
+                mtime_dt = datetime.fromtimestamp(mtime)
                 backup_results.append({
                     "path": file_path,
-                    "size": file_info["size"],
-                    "mtime": file_info["mtime"],
-                    "mtime_iso": file_info["mtime_iso"],
-                    "mtime_date": file_info["mtime_date"],
-                    "category": file_info.get("category", "track"),
-                    "backup_path": file_info["backup_path"],
-                    "filename": file_info["filename"],
-                    "full_backup_path": str(backup_path / file_info["backup_path"])
+                    "size": size,
+                    "mtime": mtime,
+                    "mtime_iso": mtime_dt.isoformat(),
+                    "mtime_date": mtime_dt.strftime("%Y-%m-%d"),
+                    "category": category,
+                    "backup_path": entry_path,
+                    "filename": filename,
+                    "full_backup_path": str(backup_path / entry_path)
                 })
             
             if backup_results:
-                # Sort files by name
-                backup_results.sort(key=lambda x: x["filename"])
+                # Sort files by name (then path, so the order doesn't depend on the catalog source)
+                backup_results.sort(key=lambda x: (x["filename"], x["path"]))
                 results[backup_path.name] = {
                     "backup_path": str(backup_path),
-                    "backup_timestamp": metadata.get('backup_timestamp', ''),
+                    "backup_timestamp": backup_timestamp,
                     "files": backup_results,
                     "total_files": len(backup_results)
                 }
@@ -366,43 +865,62 @@ class BackupExplorer:
     
     def _print_search_stats(self, results: Dict):
         """Print search statistics"""
-        total_files = sum(len(b["files"]) for b in results.values())
-        total_size = sum(f["size"] for b in results.values() for f in b["files"])
-        
-        print(f"\n{Colors.BOLD}Search results:{Colors.END}")
-        print(f"   {Colors.CYAN}Backups:{Colors.END} {len(results)}")
-        print(f"   {Colors.CYAN}Files:{Colors.END} {total_files}")
-        print(f"   {Colors.CYAN}Size:{Colors.END} {self.format_size(total_size)}")
+        total_files = total_size = tracked = deleted = 0
+        for backup_info in results.values():
+            files = backup_info["files"]
+            total_files += len(files)
+            for file_info in files:
+                total_size += file_info["size"]
+                category = file_info.get("category")
+                if category in TRACKED_CATEGORIES:
+                    tracked += 1
+                elif category in DELETED_CATEGORIES:
+                    deleted += 1
         
-        tracked = sum(1 for b in results.values() for f in b["files"] if f.get("category") in ["track", "tracked"])
-        deleted = sum(1 for b in results.values() for f in b["files"] if f.get("category") in ["delete", "deleted"])
-        print(f"   {Colors.GREEN}Tracked:{Colors.END} {tracked}, {Colors.RED}Deleted:{Colors.END} {deleted}")
+        sys.stdout.write(
+            f"\n{Colors.BOLD}Search results:{Colors.END}\n"
+            f"   {Colors.CYAN}Backups:{Colors.END} {len(results)}\n"
+            f"   {Colors.CYAN}Files:{Colors.END} {total_files}\n"
+            f"   {Colors.CYAN}Size:{Colors.END} {self.format_size(total_size)}\n"
+            f"   {Colors.GREEN}Tracked:{Colors.END} {tracked}, {Colors.RED}Deleted:{Colors.END} {deleted}\n"
+        )
     
     def print_results(self, results: Dict, show_full_paths: bool = False):
         """Improved output grouped by directories with aligned table"""
         if not results:
             print("🤷 No files found")
             return
+        
+        # Output is collected and written once per backup: few write calls, and the
+        # buffer doesn't grow with the whole result set
+        out = []
+        append = out.append
+        write = sys.stdout.write
+        if show_full_paths:
+            table_header = "     {:<60} {:>10} {:>10} {:>10}\n".format("File path", "Size", "Date", "Status")
+            table_header += "     " + "-"*62 + " " + "-"*10 + " " + "-"*12 + " " + "-"*6 + "\n"
+        else:
+            table_header = "     {:<28} {:>10} {:>10} {:>10}\n".format("File name", "Size", "Date", "Status")
+            table_header += "     " + "-"*30 + " " + "-"*10 + " " + "-"*12 + " " + "-"*6 + "\n"
+        format_size = self.format_size
+        color_end = Colors.END
 
         for backup_name, backup_info in results.items():
+            if out:
+                write(''.join(out))
+                out.clear()
             display_timestamp = self.format_timestamp_display(backup_info['backup_timestamp'])
-            print(f"\n{Colors.BOLD}📦 {backup_name} ({display_timestamp}){Colors.END}")
+            append(f"\n{Colors.BOLD}📦 {backup_name} ({display_timestamp}){Colors.END}\n")
 
             files = backup_info["files"]
             if not files:
-                print("  (empty)")
+                append("  (empty)\n")
                 continue
 
             # Group files by directory
-            files_by_dir = {}
+            files_by_dir = defaultdict(list)
             for file_info in files:
-                full_path = file_info['path']
-                dir_path = str(Path(full_path).parent)
-                file_name = Path(full_path).name
-                
-                if dir_path not in files_by_dir:
-                    files_by_dir[dir_path] = []
-                files_by_dir[dir_path].append(file_info)
+                files_by_dir[file_info['path'].rpartition('/')[0] or '.'].append(file_info)
 
             # Sort directories alphabetically
             sorted_dirs = sorted(files_by_dir.keys())
@@ -410,57 +928,33 @@ class BackupExplorer:
             for dir_path in sorted_dirs:
                 dir_files = files_by_dir[dir_path]
                 
-                # Directory header
-                print(f"\n  {Colors.BLUE}📁 {dir_path}/{Colors.END}")
-                
-                # Column headers with fixed width
-                if show_full_paths:
-                    print("     {:<60} {:>10} {:>10} {:>10}".format(
-                        "File path", "Size", "Date", "Status"
-                    ))
-                    print("     " + "-"*62 + " " + "-"*10 + " " + "-"*12 + " " + "-"*6)
-                else:
-                    print("     {:<28} {:>10} {:>10} {:>10}".format(
-                        "File name", "Size", "Date", "Status"
-                    ))
-                    print("     " + "-"*30 + " " + "-"*10 + " " + "-"*12 + " " + "-"*6)
+                # Directory header and column headers with fixed width
+                append(f"\n  {Colors.BLUE}📁 {dir_path}/{Colors.END}\n")
+                append(table_header)
                 
                 for file_info in dir_files:
-                    size_str = self.format_size(file_info["size"])
-                    category = file_info.get("category", "track")
-                    mtime_date = file_info.get("mtime_date", 
-                        datetime.fromtimestamp(file_info["mtime"]).strftime("%Y-%m-%d"))
-                    
-                    # Color and status
-                    if category in ["track", "tracked"]:
-                        color_start, status = Colors.GREEN, "✅"
-                    else:
-                        color_start, status = Colors.RED, "❌"
-                    color_end = Colors.END
+                    size_str = format_size(file_info["size"])
+                    mtime_date = (file_info.get("mtime_date") or
+                                  datetime.fromtimestamp(file_info["mtime"]).strftime("%Y-%m-%d"))
+                    color_start, status = CATEGORY_STYLES.get(file_info.get("category", "track"), DELETED_STYLE)
                     
                     if show_full_paths:
                         display_text = file_info['path']
                         max_length = 58
                     else:
-                        file_name = Path(file_info['path']).name
-                        name_part, ext_part = Path(file_name).stem, Path(file_name).suffix
+                        file_name = file_info['path'].rpartition('/')[2]
+                        name_part, ext_part = split_extension(file_name)
                         max_length = 25
                         if len(name_part) > max_length:
                             display_text = f"{name_part[:max_length-3]}...{ext_part}"
                         else:
                             display_text = file_name
                     
+                    # Colored text is always wider than its column, so it needs no padding of its own
                     display_text = display_text.ljust(max_length + 2)
-                    colored_text = f"{color_start}{display_text}{color_end}"
-                    
-                    if show_full_paths:
-                        print("     {:<60} {:>9} {:>12} {:>4}".format(
-                            colored_text, size_str, mtime_date, status
-                        ))
-                    else:
-                        print("     {:<30} {:>9} {:>12} {:>4}".format(
-                            colored_text, size_str, mtime_date, status
-                        ))
+                    append(f"     {color_start}{display_text}{color_end} {size_str:>9} {mtime_date:>12} {status:>4}\n")
+        
+        write(''.join(out))
     
     def generate_restore_script(self, results: Dict, output_script: Path):
         """Generate a shell script to restore found files"""
@@ -479,16 +973,17 @@ class BackupExplorer:
             f.write("echo \"Restoring files to $DEST_DIR\"\n")
             f.write("\n")
             
-            for backup_name, backup_info in results.items():
-                backup_path = backup_info["backup_path"]
+            # One line per file: build them in memory and write in one call
+            lines = []
+            append = lines.append
+            for backup_info in results.values():
                 for file_info in backup_info["files"]:
-                    src_path = file_info["full_backup_path"]
-                    dest_path = f"\"$DEST_DIR/{file_info['path']}\""
-                    dest_dir = f"\"$DEST_DIR/{Path(file_info['path']).parent}\""
-                    
-                    f.write(f"mkdir -p {dest_dir} && ")
-                    f.write(f"cp -p \"{src_path}\" {dest_path} && ")
-                    f.write(f"echo \"Restored {file_info['path']}\"\n")
+                    rel_path = file_info["path"]
+                    parent = rel_path.rpartition('/')[0] or '.'
+                    append(f"mkdir -p \"$DEST_DIR/{parent}\" && "
+                           f"cp -p \"{file_info['full_backup_path']}\" \"$DEST_DIR/{rel_path}\" && "
+                           f"echo \"Restored {rel_path}\"\n")
+            f.write(''.join(lines))
             
             f.write("\n")
             f.write("echo \"Restore completed\"\n")
@@ -506,28 +1001,36 @@ class BackupExplorer:
             print("No backups found")
             return
         
-        print(f"\n{Colors.BOLD}Found {len(backups)} backups:{Colors.END}")
+        out = [f"\n{Colors.BOLD}Found {len(backups)} backups:{Colors.END}\n"]
+        append = out.append
         
+        self.preload_metadata(backups)
         for backup_path in backups:
             metadata = self.load_metadata(backup_path)
             if metadata:
                 display_timestamp = self.format_timestamp_display(metadata.get('backup_timestamp', 'unknown'))
-                print(f"\n{Colors.BOLD}{backup_path.name}:{Colors.END}")
-                print(f"  {Colors.CYAN}Time:{Colors.END} {display_timestamp}")
-                print(f"  {Colors.CYAN}Type:{Colors.END} {metadata.get('backup_type', 'unknown')}")
+                append(f"\n{Colors.BOLD}{backup_path.name}:{Colors.END}\n")
+                append(f"  {Colors.CYAN}Time:{Colors.END} {display_timestamp}\n")
+                append(f"  {Colors.CYAN}Type:{Colors.END} {metadata.get('backup_type', 'unknown')}\n")
                 if "summary" in metadata:
                     summary = metadata["summary"]
-                    print(f"  {Colors.GREEN}Tracked:{Colors.END} {summary.get('new_or_changed_tracked', 0)} files")
-                    print(f"  {Colors.RED}Deleted:{Colors.END} {summary.get('deleted_tracked', 0)} files")
-                    print(f"  {Colors.CYAN}Total operations:{Colors.END} {summary.get('total_operations', 0)}")
+                    append(f"  {Colors.GREEN}Tracked:{Colors.END} {summary.get('new_or_changed_tracked', 0)} files\n")
+                    append(f"  {Colors.RED}Deleted:{Colors.END} {summary.get('deleted_tracked', 0)} files\n")
+                    append(f"  {Colors.CYAN}Total operations:{Colors.END} {summary.get('total_operations', 0)}\n")
                 
                 if detailed and "statistics" in metadata:
                     stats = metadata["statistics"]
                     size_str = self.format_size(stats.get('total_size', 0))
-                    print(f"  {Colors.CYAN}Size:{Colors.END} {size_str}")
-                    print(f"  {Colors.CYAN}Files:{Colors.END} {stats.get('total_files', 0)}")
+                    append(f"  {Colors.CYAN}Size:{Colors.END} {size_str}\n")
+                    append(f"  {Colors.CYAN}Files:{Colors.END} {stats.get('total_files', 0)}\n")
             else:
-                print(f"\n{Colors.YELLOW}{backup_path.name}: (no metadata){Colors.END}")
+                append(f"\n{Colors.YELLOW}{backup_path.name}: (no metadata){Colors.END}\n")
+        
+        sys.stdout.write(''.join(out))
+
+def recreate_backup_metadata(backup_dir: str, backup_path: str, force: bool) -> bool:
+    """Recreate metadata of one backup (task for the process pool)"""
+    return BackupExplorer(Path(backup_dir)).recreate_metadata(Path(backup_path), force)
 
 def main():
     parser = argparse.ArgumentParser(description='Utility for exploring incremental backups')
@@ -584,7 +1087,11 @@ def main():
             )
             
             if args.json:
-                print(json.dumps(results, indent=2, ensure_ascii=False))
+                # Streamed per backup: the whole document is never built in memory at once
+                sys.stdout.flush()
+                for chunk in iter_json_object_chunks(results):
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.write(b'\n')
             else:
                 explorer.print_results(results, args.full_paths)
                 if results:
@@ -598,9 +1105,7 @@ def main():
             parser.print_help()
             
     except Exception as e:
-        logger.error(f"Error: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception("Error: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":